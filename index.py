@@ -1,25 +1,43 @@
+import time
+STARTUP_TIME = time.perf_counter()
+
 import sys
 import os
 import datetime
-import pandas as pd
 from PyQt5.QtWidgets import (QApplication, QMainWindow, QVBoxLayout, QHBoxLayout, 
                             QWidget, QLabel, QPushButton, QTableWidget, 
                             QTableWidgetItem, QLineEdit, QMessageBox, QFileDialog,
-                            QTabWidget, QGroupBox, QStackedWidget, QComboBox, QFrame)
-from PyQt5.QtCore import Qt, QTimer, QPropertyAnimation, QEasingCurve, QPoint
+                            QTabWidget, QGroupBox, QStackedWidget, QComboBox, QFrame,
+                            QTableView, QProgressBar)
+from PyQt5.QtCore import (Qt, QTimer, QPropertyAnimation, QEasingCurve, QPoint, QThread, pyqtSignal,
+                          QAbstractTableModel, QModelIndex)
 from PyQt5.QtGui import QFont, QIcon, QColor, QPixmap, QPalette
-import speech_recognition as sr
-from pygame import mixer
-import soundfile as sf
-import numpy as np
-from sklearn.metrics.pairwise import cosine_similarity
-from sklearn.feature_extraction.text import TfidfVectorizer
 import warnings
 from dotenv import load_dotenv
-from pymongo import MongoClient
+from pymongo.errors import PyMongoError
 import bcrypt
 import uuid
 import logging
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from voice_attendance.lazy import sr, sd
+from voice_attendance.features import StatsFeatureExtractor, get_feature_extractor, audio_data_to_samples
+from voice_attendance.matching import VoiceprintIndex, UtteranceSegmenter, match_voiceprint, create_voiceprint_index
+from voice_attendance.calibration import MicrophoneCalibrationCache
+from voice_attendance.repository import (DATABASE_NAME, STUDENT_FIELDS, get_mongo_client, ensure_indexes,
+                                         session_date, migrate_voice_features, bump_voiceprint_version,
+                                         voiceprint_fields, find_classes, add_class, find_students, find_student,
+                                         student_exists, insert_student, student_counts, attendance_record,
+                                         write_attendance, section_attendance, marked_student_ids,
+                                         delete_attendance)
+from voice_attendance.store import VoiceprintStore, VoiceTemplateCache
+from voice_attendance.sync import StudentSync
+from voice_attendance.reports import (write_rows, filter_roster, daily_totals_rows, student_summary_rows,
+                                      presence_matrix_rows, attendance_query, attendance_cursor,
+                                      export_attendance)
+from voice_attendance.cli import build_parser, has_command, run_command_line
 
 warnings.filterwarnings("ignore")
 
@@ -37,6 +55,480 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+class RollCallWorker(QThread):
+    """Keeps the microphone stream open and matches every detected utterance"""
+    listening = pyqtSignal()
+    segment_detected = pyqtSignal(float)
+    matched = pyqtSignal(object, float)
+    no_match = pyqtSignal(str)
+    failed = pyqtSignal(str)
+    
+    def __init__(self, match_fn, sample_rate=None, block_ms=100, parent=None):
+        super().__init__(parent)
+        self.match_fn = match_fn
+        self.sample_rate = sample_rate
+        self.block_ms = block_ms
+        self.blocks = queue.Queue()
+        self.running = False
+    
+    def stop(self):
+        """Ask the stream loop to finish after the current block"""
+        self.running = False
+    
+    def _on_block(self, indata, frames, time_info, status):
+        """sounddevice callback; hands blocks to the segmentation loop"""
+        if status:
+            logger.warning(f"Audio stream status: {status}")
+        self.blocks.put(indata.copy())
+    
+    def _match(self, segment, sample_rate):
+        """Match one utterance (runs on the matching pool)"""
+        try:
+            student, score = self.match_fn(segment, sample_rate)
+            if student:
+                self.matched.emit(student, score)
+            else:
+                self.no_match.emit("No matching voice found")
+        except Exception as e:
+            logger.error(f"Error matching roll call segment: {str(e)}")
+            self.failed.emit(str(e))
+    
+    def _submit(self, executor, segments, sample_rate):
+        """Hand completed utterances to the matching pool"""
+        for _, segment in segments:
+            self.segment_detected.emit(len(segment) / sample_rate)
+            executor.submit(self._match, segment, sample_rate)
+    
+    def run(self):
+        self.running = True
+        executor = ThreadPoolExecutor(max_workers=2)
+        try:
+            sample_rate = self.sample_rate or int(sd.query_devices(kind='input')['default_samplerate'])
+            segmenter = UtteranceSegmenter(sample_rate)
+            blocksize = int(sample_rate * self.block_ms / 1000)
+            
+            with sd.InputStream(samplerate=sample_rate, channels=1, dtype='float32',
+                                blocksize=blocksize, callback=self._on_block):
+                logger.info(f"Roll call stream opened at {sample_rate} Hz")
+                self.listening.emit()
+                while self.running:
+                    try:
+                        block = self.blocks.get(timeout=0.1)
+                    except queue.Empty:
+                        continue
+                    
+                    # Segment on this thread, match on the pool so capture never waits
+                    self._submit(executor, segmenter.feed(block), sample_rate)
+            
+            # Drain blocks captured before the stream closed, then match the utterance still open at Stop
+            while not self.blocks.empty():
+                self._submit(executor, segmenter.feed(self.blocks.get_nowait()), sample_rate)
+            self._submit(executor, segmenter.flush(), sample_rate)
+            logger.info("Roll call stream closed")
+        except Exception as e:
+            logger.error(f"Error during roll call: {str(e)}")
+            self.failed.emit(str(e))
+        finally:
+            executor.shutdown(wait=True)
+
+class ExportWorker(QThread):
+    """Streams a MongoDB query straight into an export file on a background thread"""
+    progress = pyqtSignal(int, int)
+    completed = pyqtSignal(str, int)
+    failed = pyqtSignal(str)
+    
+    def __init__(self, collection, query, sort, projection, headers, row_fn, filepath, parent=None):
+        super().__init__(parent)
+        self.collection = collection
+        self.query = query
+        self.sort = sort
+        self.projection = projection
+        self.headers = headers
+        self.row_fn = row_fn
+        self.filepath = filepath
+    
+    def run(self):
+        try:
+            count = export_attendance(self.collection, self.query, self.sort, self.projection, self.headers,
+                                      self.row_fn, self.filepath, self.progress.emit)
+            self.completed.emit(self.filepath, count)
+        except Exception as e:
+            logger.error(f"Error exporting to {self.filepath}: {str(e)}")
+            self.failed.emit(str(e))
+
+class BackgroundTask(QThread):
+    """Runs a callable off the GUI thread and reports its result"""
+    done = pyqtSignal(object)
+    failed = pyqtSignal(str)
+    
+    def __init__(self, fn, *args, parent=None):
+        super().__init__(parent)
+        self.fn = fn
+        self.args = args
+    
+    def run(self):
+        try:
+            self.done.emit(self.fn(*self.args))
+        except Exception as e:
+            logger.error(f"Background task {getattr(self.fn, '__name__', self.fn)} failed: {str(e)}")
+            self.failed.emit(str(e))
+
+class MicrophoneCalibrationWorker(QThread):
+    """Measures ambient noise in the background"""
+    calibrated = pyqtSignal(float)
+    failed = pyqtSignal(str)
+    
+    def __init__(self, recognizer, microphone, duration=1, parent=None):
+        super().__init__(parent)
+        self.recognizer = recognizer
+        self.microphone = microphone
+        self.duration = duration
+    
+    def run(self):
+        try:
+            with self.microphone as source:
+                self.recognizer.adjust_for_ambient_noise(source, duration=self.duration)
+            self.calibrated.emit(self.recognizer.energy_threshold)
+        except Exception as e:
+            logger.error(f"Error calibrating microphone: {str(e)}")
+            self.failed.emit(str(e))
+
+class VoiceCaptureWorker(QThread):
+    """Captures one utterance off the GUI thread and optionally matches it"""
+    listening = pyqtSignal()
+    captured = pyqtSignal(object)
+    matched = pyqtSignal(object, float)
+    no_match = pyqtSignal(str)
+    timed_out = pyqtSignal()
+    failed = pyqtSignal(str)
+    
+    def __init__(self, recognizer, microphone, match_fn=None, timeout=5, parent=None):
+        super().__init__(parent)
+        self.recognizer = recognizer
+        self.microphone = microphone
+        self.match_fn = match_fn
+        self.timeout = timeout
+    
+    def run(self):
+        try:
+            with self.microphone as source:
+                self.listening.emit()
+                logger.info("Starting voice capture...")
+                audio = self.recognizer.listen(source, timeout=self.timeout)
+                logger.info("Voice capture completed")
+            self.captured.emit(audio)
+            
+            if self.match_fn is None:
+                return
+            
+            student, score = self.match_fn(audio)
+            if student:
+                self.matched.emit(student, score)
+            else:
+                self.no_match.emit("No matching voice found")
+        except sr.WaitTimeoutError:
+            self.timed_out.emit()
+        except Exception as e:
+            logger.error(f"Error during voice capture: {str(e)}")
+            self.failed.emit(str(e))
+
+class AttendanceWriter(QThread):
+    """Writes attendance records to MongoDB from a queue on a background thread"""
+    written = pyqtSignal(object)
+    duplicate = pyqtSignal(object)
+    failed = pyqtSignal(object, str)
+    
+    def __init__(self, db, parent=None):
+        super().__init__(parent)
+        self.db = db
+        self.queue = queue.Queue()
+    
+    def submit(self, record):
+        """Queue a record for insertion"""
+        self.queue.put(record)
+    
+    def stop(self):
+        """Finish pending writes and stop the thread"""
+        self.queue.put(None)
+        self.wait()
+    
+    def run(self):
+        while True:
+            record = self.queue.get()
+            if record is None:
+                break
+            
+            try:
+                # The write skips students already marked for the session, so no pre-read is needed
+                if write_attendance(self.db, [record]):
+                    self.written.emit(record)
+                else:
+                    self.duplicate.emit(record)
+            except Exception as e:
+                logger.error(f"Error writing attendance for {record['student_id']}: {str(e)}")
+                self.failed.emit(record, str(e))
+
+class StudentSyncWorker(QThread):
+    """Delivers student changes made at other stations from a change stream or polling"""
+    changed = pyqtSignal(object)
+    
+    def __init__(self, sync, parent=None):
+        super().__init__(parent)
+        self.sync = sync
+        self.stop_event = threading.Event()
+    
+    def stop(self):
+        """Stop following changes and wait for the thread"""
+        self.stop_event.set()
+        self.wait()
+    
+    def run(self):
+        try:
+            self.sync.run(self.changed.emit, self.stop_event)
+        except Exception as e:
+            logger.error(f"Student sync stopped: {str(e)}")
+
+class AttendanceTableModel(QAbstractTableModel):
+    """Today's attendance records for the active section, newest first"""
+    headers = ["ID", "Name", "Class", "Time", "Status"]
+    
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.records = []
+        self.class_name = ""
+    
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.records)
+    
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.headers)
+    
+    @staticmethod
+    def format_record(record, class_name):
+        return [
+            record['student_id'],
+            record['name'],
+            class_name,
+            record['date'].strftime("%Y-%m-%d %H:%M:%S"),
+            record['status']
+        ]
+    
+    def row_values(self, row):
+        return self.format_record(self.records[row], self.class_name)
+    
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid() or role != Qt.DisplayRole:
+            return None
+        return self.row_values(index.row())[index.column()]
+    
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and orientation == Qt.Horizontal:
+            return self.headers[section]
+        return None
+    
+    def set_records(self, records, class_name):
+        """Replace all rows, used when the section changes"""
+        self.beginResetModel()
+        self.records = list(records)
+        self.class_name = class_name
+        self.endResetModel()
+    
+    def add_record(self, record):
+        """Insert a single newly written record at the top"""
+        self.beginInsertRows(QModelIndex(), 0, 0)
+        self.records.insert(0, record)
+        self.endInsertRows()
+
+class ReportTableModel(QAbstractTableModel):
+    """Cursor-backed attendance report that fetches rows in batches as the view scrolls"""
+    headers = ["Date", "Class", "Section", "Student ID", "Name", "Status"]
+    fields = ["date", "class_id", "section", "student_id", "name", "status"]
+    failed = pyqtSignal(str)
+    
+    def __init__(self, class_name_fn, batch_size=500, parent=None):
+        super().__init__(parent)
+        self.class_name_fn = class_name_fn
+        self.batch_size = batch_size
+        self.collection = None
+        self.query = {}
+        self.sort_field = "date"
+        self.sort_order = -1
+        self.cursor = None
+        self.records = []
+        self.exhausted = True
+    
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.records)
+    
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.headers)
+    
+    def format_record(self, record):
+        return [
+            record['date'].strftime("%Y-%m-%d"),
+            self.class_name_fn(record['class_id']),
+            record['section'],
+            record['student_id'],
+            record['name'],
+            record['status']
+        ]
+    
+    def row_values(self, row):
+        return self.format_record(self.records[row])
+    
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid() or role != Qt.DisplayRole:
+            return None
+        return self.row_values(index.row())[index.column()]
+    
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and orientation == Qt.Horizontal:
+            return self.headers[section]
+        return None
+    
+    def projection(self):
+        return dict({field: 1 for field in self.fields}, _id=0)
+    
+    def sort_spec(self):
+        return [(self.sort_field, self.sort_order), ("_id", self.sort_order)]
+    
+    def set_query(self, collection, query):
+        """Run a new report query, discarding any rows already fetched"""
+        self.collection = collection
+        self.query = query
+        self.reload()
+    
+    def open_cursor(self, skip=0):
+        """Open a cursor over the query, skipping rows already fetched"""
+        # Only the displayed fields are fetched, sorted by MongoDB
+        return attendance_cursor(self.collection, self.query, self.projection(), self.sort_spec(), skip,
+                                 self.batch_size)
+    
+    def close_cursor(self):
+        if self.cursor is not None:
+            try:
+                self.cursor.close()
+            except PyMongoError:
+                pass
+        self.cursor = None
+    
+    def reload(self):
+        """Reopen the cursor with the current query and sort"""
+        # Qt calls this from sort(); an exception escaping here would abort the process
+        self.beginResetModel()
+        self.close_cursor()
+        self.records = []
+        if self.collection is not None:
+            try:
+                self.cursor = self.open_cursor()
+            except PyMongoError as e:
+                self.report_failure(e)
+        self.exhausted = self.cursor is None
+        self.endResetModel()
+        self.fetchMore()
+    
+    def report_failure(self, error):
+        """Stop fetching and tell the view why the report is incomplete"""
+        logger.error(f"Error fetching report rows: {str(error)}")
+        self.close_cursor()
+        self.exhausted = True
+        self.failed.emit(str(error))
+    
+    def canFetchMore(self, parent=QModelIndex()):
+        return not parent.isValid() and not self.exhausted
+    
+    def fetchMore(self, parent=QModelIndex()):
+        if parent.isValid() or self.exhausted:
+            return
+        
+        batch = []
+        reopened = False
+        while len(batch) < self.batch_size:
+            try:
+                record = next(self.cursor, None)
+            except PyMongoError as e:
+                # The server drops idle cursors, so resume once from the rows already shown
+                if reopened:
+                    self.report_failure(e)
+                    break
+                logger.warning(f"Report cursor lost, reopening: {str(e)}")
+                reopened = True
+                try:
+                    self.close_cursor()
+                    self.cursor = self.open_cursor(len(self.records) + len(batch))
+                except PyMongoError as e:
+                    self.report_failure(e)
+                    break
+                continue
+            if record is None:
+                self.exhausted = True
+                break
+            batch.append(record)
+        
+        if batch:
+            self.beginInsertRows(QModelIndex(), len(self.records), len(self.records) + len(batch) - 1)
+            self.records.extend(batch)
+            self.endInsertRows()
+    
+    def fetch_all(self):
+        """Fetch every remaining row"""
+        while self.canFetchMore():
+            self.fetchMore()
+    
+    def sortable(self, column):
+        """Whether MongoDB can sort a column in the order it is displayed"""
+        # Class IDs are ObjectIds, whose order has nothing to do with the class names shown
+        return self.fields[column] != "class_id"
+    
+    def sort_indicator(self):
+        """Header column and order matching the current sort"""
+        return self.fields.index(self.sort_field), Qt.AscendingOrder if self.sort_order == 1 else Qt.DescendingOrder
+    
+    def sort(self, column, order=Qt.AscendingOrder):
+        """Re-query with the sort pushed down to MongoDB"""
+        if not self.sortable(column):
+            return
+        self.sort_field = self.fields[column]
+        self.sort_order = 1 if order == Qt.AscendingOrder else -1
+        if self.collection is not None:
+            self.reload()
+
+class SummaryTableModel(QAbstractTableModel):
+    """In-memory table for compact summary reports"""
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.headers = []
+        self.rows = []
+    
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.rows)
+    
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.headers)
+    
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid() or role != Qt.DisplayRole:
+            return None
+        return str(self.rows[index.row()][index.column()])
+    
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and orientation == Qt.Horizontal:
+            return self.headers[section]
+        return None
+    
+    def set_rows(self, headers, rows):
+        self.beginResetModel()
+        self.headers = headers
+        self.rows = rows
+        self.endResetModel()
+    
+    def sort(self, column, order=Qt.AscendingOrder):
+        if column >= len(self.headers):
+            return
+        self.layoutAboutToBeChanged.emit()
+        self.rows.sort(key=lambda row: row[column], reverse=order == Qt.DescendingOrder)
+        self.layoutChanged.emit()
+
 class LoginWindow(QWidget):
     def __init__(self, parent=None):
         super().__init__(parent)
@@ -75,7 +567,14 @@ class LoginWindow(QWidget):
                 border: 1px solid #ddd;
             }
         """)
+        self.first_paint_logged = False
         self.init_ui()
+    
+    def paintEvent(self, event):
+        super().paintEvent(event)
+        if not self.first_paint_logged:
+            self.first_paint_logged = True
+            logger.info(f"Login window first paint {(time.perf_counter() - STARTUP_TIME) * 1000:.0f} ms after start")
         
     def init_ui(self):
         layout = QHBoxLayout()
@@ -214,7 +713,56 @@ class VoiceAttendanceSystem(QMainWindow):
         self.db = None
         self.students_col = None
         self.attendance_col = None
-        self.classes_col = None
+        self.summary_col = None
+        
+        # In-memory voiceprint index, kept in sync with enrolled students
+        self.students = []
+        self.feature_extractor = get_feature_extractor()
+        self.voice_index = create_voiceprint_index()
+        
+        # On-disk copy of the voiceprints and the database version it reflects
+        self.voiceprint_store = VoiceprintStore(self.feature_extractor.name)
+        self.voiceprint_version = None
+        self.voiceprints_dirty = False
+        
+        # Multi-sample enrollment: samples per student, the capture in progress and its extraction pool
+        self.enrollment_samples = max(1, int(os.getenv("ENROLLMENT_SAMPLES", "3")))
+        self.enrollment = None
+        self.extraction_pool = ThreadPoolExecutor(max_workers=2)
+        self.voice_templates = None
+        
+        # Classes and an _id lookup, maintained by load_classes
+        self.classes = []
+        self.classes_by_id = {}
+        
+        # Enrollment counts per class/section, invalidated on enrollment
+        self.student_counts = None
+        
+        # Sub-index for the class/section selected on the attendance tab
+        self.section_key = None
+        self.section_student_ids = []
+        self.section_index = VoiceprintIndex()
+        
+        # Kiosk stations identify students campus-wide and mark them under their own class/section
+        self.kiosk = os.getenv("ATTENDANCE_KIOSK", "0") == "1"
+        
+        # Students already marked today in the active section
+        self.marked_today = set()
+        self.marked_today_date = None
+        
+        # Background threads for audio capture and attendance writes
+        self.capture_worker = None
+        self.roll_call_worker = None
+        self.roll_call_marked = set()
+        self.attendance_writer = None
+        self.sync_worker = None
+        self.data_loaded_at = None
+        
+        # Cached per-device microphone energy thresholds
+        self.calibration_cache = MicrophoneCalibrationCache()
+        self.microphone_key = None
+        self.recognizer = None
+        self.microphone = None
         
         # Create stacked widget for login/main app
         self.stacked_widget = QStackedWidget()
@@ -229,31 +777,51 @@ class VoiceAttendanceSystem(QMainWindow):
         
         # Show login page first
         self.stacked_widget.setCurrentIndex(0)
+        
+        # Warm the database connection while the login form is displayed
+        self.main_app_shown = False
+        self.data_task = None
+        self.db_task = BackgroundTask(self.connect_to_mongodb)
+        self.db_task.done.connect(self.on_database_connected)
+        self.db_task.failed.connect(self.on_database_failed)
+        self.db_task.start()
     
     def connect_to_mongodb(self):
-        """Connect to MongoDB and initialize collections"""
-        try:
-            mongodb_uri = os.getenv("MONGO_URI", "mongodb://localhost:27017/")
-            logger.info(f"Connecting to MongoDB at: {mongodb_uri}")
-            
-            self.client = MongoClient(mongodb_uri, serverSelectionTimeoutMS=5000)
-            # Test the connection
-            self.client.server_info()
-            
-            self.db = self.client["voice_attendance_system"]
-            self.students_col = self.db["students"]
-            self.attendance_col = self.db["attendance"]
-            self.classes_col = self.db["classes"]
-            
-            # Create indexes if they don't exist
-            self.students_col.create_index("student_id", unique=True)
-            self.attendance_col.create_index([("student_id", 1), ("date", 1)], unique=True)
-            
-            logger.info("Successfully connected to MongoDB")
-        except Exception as e:
-            logger.error(f"Could not connect to MongoDB: {str(e)}")
-            QMessageBox.critical(self, "Database Error", f"Could not connect to MongoDB: {str(e)}")
-            sys.exit(1)
+        """Connect to MongoDB and make sure indexes exist (runs on a background thread)"""
+        client = get_mongo_client()
+        # Test the connection
+        client.admin.command("ping")
+        
+        db = client[DATABASE_NAME]
+        ensure_indexes(db)
+        return db
+    
+    def on_database_connected(self, db):
+        """Initialize collections once the background connection succeeds"""
+        self.client = db.client
+        self.db = db
+        self.students_col = self.db["students"]
+        self.attendance_col = self.db["attendance"]
+        self.summary_col = self.db["daily_attendance_summary"]
+        self.voice_templates = VoiceTemplateCache(self.students_col, self.feature_extractor.name)
+        
+        # Start the background attendance writer
+        if self.attendance_writer is None:
+            self.attendance_writer = AttendanceWriter(self.db)
+            self.attendance_writer.written.connect(self.on_attendance_written)
+            self.attendance_writer.duplicate.connect(self.on_attendance_duplicate)
+            self.attendance_writer.failed.connect(self.on_attendance_write_failed)
+            self.attendance_writer.start()
+        
+        logger.info("Successfully connected to MongoDB")
+        if self.main_app_shown:
+            self.start_data_load()
+    
+    def on_database_failed(self, error):
+        """Report a failed background connection and quit"""
+        logger.error(f"Could not connect to MongoDB: {error}")
+        QMessageBox.critical(self, "Database Error", f"Could not connect to MongoDB: {error}")
+        sys.exit(1)
     
     def show_main_app(self):
         """Show the main application after successful login"""
@@ -264,11 +832,9 @@ class VoiceAttendanceSystem(QMainWindow):
                 self.init_ui()
                 self.stacked_widget.addWidget(self.main_app_page)
             
-            # Connect to MongoDB
-            self.connect_to_mongodb()
-            
             # Set current widget to main app
             self.stacked_widget.setCurrentIndex(1)
+            self.main_app_shown = True
             
             # Create fade in animation
             self.main_app_page.setWindowOpacity(0)
@@ -279,15 +845,55 @@ class VoiceAttendanceSystem(QMainWindow):
             self.animation.setEasingCurve(QEasingCurve.InOutQuad)
             self.animation.start()
             
-            # Load data
-            self.load_classes()
-            self.load_enrolled_students()
+            # Load data now if the connection is already warm, otherwise once it is
+            self.tabs.setEnabled(False)
+            if self.db is not None:
+                self.start_data_load()
             
-            logger.info("Main application loaded successfully")
+            # Open the microphone once the main window has been painted
+            QTimer.singleShot(0, lambda: self.on_tab_changed(self.tabs.currentIndex()))
         except Exception as e:
             logger.error(f"Error loading main application: {str(e)}")
             QMessageBox.critical(self, "Error", f"Failed to load application: {str(e)}")
     
+    def start_data_load(self):
+        """Fetch classes and students on a background thread"""
+        if self.data_task is not None and self.data_task.isRunning():
+            return
+        self.data_loaded_at = datetime.datetime.now()
+        self.data_task = BackgroundTask(self.fetch_initial_data)
+        self.data_task.done.connect(self.on_initial_data_loaded)
+        self.data_task.failed.connect(self.on_initial_data_failed)
+        self.data_task.start()
+    
+    def fetch_initial_data(self):
+        """Query classes, students and voiceprints, migrating voiceprints if needed (runs on a background thread)"""
+        classes = find_classes(self.db)
+        students = find_students(self.db)
+        self.migrate_voice_features(students)
+        return classes, students, self.voiceprint_store.open(self.db)
+    
+    def on_initial_data_loaded(self, data):
+        """Populate the UI with the data fetched in the background"""
+        classes, students, voiceprints = data
+        self.load_classes(classes)
+        self.load_enrolled_students(students, voiceprints)
+        self.start_student_sync()
+        self.tabs.setEnabled(True)
+        logger.info("Main application loaded successfully")
+    
+    def on_initial_data_failed(self, error):
+        """Offer to retry a failed initial load rather than leave the window disabled"""
+        reply = QMessageBox.critical(
+            self, "Error", f"Failed to load application: {error}\n\nRetry loading classes and students?",
+            QMessageBox.Retry | QMessageBox.Close, QMessageBox.Retry)
+        if reply == QMessageBox.Retry:
+            # failed is emitted just before the task's thread finishes
+            self.data_task.wait()
+            self.start_data_load()
+        else:
+            self.tabs.setEnabled(True)
+    
     def init_ui(self):
         """Initialize the main application UI"""
         try:
@@ -314,6 +920,13 @@ class VoiceAttendanceSystem(QMainWindow):
             self.setup_classes_tab()
             self.setup_reports_tab()
             
+            # Export progress, shown in the status bar while an export runs
+            self.export_worker = None
+            self.export_progress = QProgressBar()
+            self.export_progress.setMaximumWidth(250)
+            self.export_progress.hide()
+            self.statusBar().addPermanentWidget(self.export_progress)
+            
             # Add tabs to main layout
             main_layout.addWidget(self.tabs)
             self.main_app_page.setLayout(main_layout)
@@ -321,12 +934,9 @@ class VoiceAttendanceSystem(QMainWindow):
             # Apply stylesheet
             self.setStyleSheet(self.get_stylesheet())
             
-            # Initialize other components
+            # Audio components are created when a tab that records is first shown
+            self.tabs.currentChanged.connect(self.on_tab_changed)
             self.create_directories()
-            mixer.init()
-            self.recognizer = sr.Recognizer()
-            self.microphone = sr.Microphone()
-            self.adjust_microphone()
             
             logger.info("UI initialized successfully")
         except Exception as e:
@@ -378,7 +988,7 @@ class VoiceAttendanceSystem(QMainWindow):
                 background: #f5f5f5;
                 border-bottom: 2px solid #4CAF50;
             }
-            QTableWidget {
+            QTableView {
                 background-color: white;
                 border: 1px solid #ddd;
                 gridline-color: #eee;
@@ -451,8 +1061,12 @@ class VoiceAttendanceSystem(QMainWindow):
             self.record_btn = QPushButton("Start Voice Attendance")
             self.record_btn.clicked.connect(self.start_attendance)
             
+            self.roll_call_btn = QPushButton("Start Continuous Roll Call")
+            self.roll_call_btn.clicked.connect(self.toggle_roll_call)
+            
             voice_layout.addWidget(self.voice_status)
             voice_layout.addWidget(self.record_btn, 0, Qt.AlignCenter)
+            voice_layout.addWidget(self.roll_call_btn, 0, Qt.AlignCenter)
             voice_group.setLayout(voice_layout)
             layout.addWidget(voice_group)
             
@@ -471,9 +1085,9 @@ class VoiceAttendanceSystem(QMainWindow):
             layout.addWidget(manual_group)
             
             # Attendance table
-            self.attendance_table = QTableWidget()
-            self.attendance_table.setColumnCount(5)
-            self.attendance_table.setHorizontalHeaderLabels(["ID", "Name", "Class", "Time", "Status"])
+            self.attendance_model = AttendanceTableModel(self)
+            self.attendance_table = QTableView()
+            self.attendance_table.setModel(self.attendance_model)
             layout.addWidget(self.attendance_table)
             
             # Buttons
@@ -504,7 +1118,7 @@ class VoiceAttendanceSystem(QMainWindow):
             self.section_combo.clear()
             
             # Find the selected class
-            selected_class = next((cls for cls in self.classes if cls['_id'] == class_id), None)
+            selected_class = self.classes_by_id.get(class_id)
             if selected_class:
                 # Add all sections of this class
                 for section in selected_class['sections']:
@@ -532,6 +1146,7 @@ class VoiceAttendanceSystem(QMainWindow):
             class_layout.addWidget(QLabel("Section:"))
             self.enroll_section_combo = QComboBox()
             class_layout.addWidget(self.enroll_section_combo)
+            self.enroll_class_combo.currentIndexChanged.connect(self.update_class_sections)
             form_layout.addLayout(class_layout)
             
             # Name and ID
@@ -628,6 +1243,7 @@ class VoiceAttendanceSystem(QMainWindow):
             filter_layout.addWidget(QLabel("Section:"))
             self.report_section_combo = QComboBox()
             filter_layout.addWidget(self.report_section_combo)
+            self.report_class_combo.currentIndexChanged.connect(self.update_report_sections)
             
             filter_layout.addWidget(QLabel("Date Range:"))
             self.report_start_date = QLineEdit()
@@ -639,6 +1255,11 @@ class VoiceAttendanceSystem(QMainWindow):
             self.report_end_date.setPlaceholderText("YYYY-MM-DD")
             filter_layout.addWidget(self.report_end_date)
             
+            filter_layout.addWidget(QLabel("Type:"))
+            self.report_type_combo = QComboBox()
+            self.report_type_combo.addItems(["Attendance Records", "Student Summary", "Presence Matrix", "Daily Totals"])
+            filter_layout.addWidget(self.report_type_combo)
+            
             self.generate_report_btn = QPushButton("Generate Report")
             self.generate_report_btn.clicked.connect(self.generate_report)
             filter_layout.addWidget(self.generate_report_btn)
@@ -646,9 +1267,16 @@ class VoiceAttendanceSystem(QMainWindow):
             layout.addLayout(filter_layout)
             
             # Report table
-            self.report_table = QTableWidget()
-            self.report_table.setColumnCount(6)
-            self.report_table.setHorizontalHeaderLabels(["Date", "Class", "Section", "Student ID", "Name", "Status"])
+            self.report_model = ReportTableModel(self.get_class_name, parent=self)
+            # Queued so the message box never opens inside a Qt-driven fetch
+            self.report_model.failed.connect(self.on_report_fetch_failed, Qt.QueuedConnection)
+            self.summary_model = SummaryTableModel(self)
+            self.summary_task = None
+            self.report_table = QTableView()
+            self.report_table.setModel(self.report_model)
+            self.report_table.horizontalHeader().setSortIndicator(0, Qt.DescendingOrder)
+            self.report_table.setSortingEnabled(True)
+            self.report_table.horizontalHeader().sortIndicatorChanged.connect(self.on_report_sort_changed)
             layout.addWidget(self.report_table)
             
             # Export button
@@ -667,20 +1295,66 @@ class VoiceAttendanceSystem(QMainWindow):
         current_time = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
         self.time_label.setText(f"Current Time: {current_time}")
     
+    def on_tab_changed(self, index):
+        """Initialise audio the first time a recording tab is shown"""
+        if self.tabs.widget(index) in (self.attendance_tab, self.enrollment_tab):
+            self.ensure_audio()
+    
+    def ensure_audio(self):
+        """Create the recognizer and microphone on first use"""
+        if self.microphone is not None:
+            return
+        try:
+            self.recognizer = sr.Recognizer()
+            self.microphone = sr.Microphone()
+            self.adjust_microphone()
+        except Exception as e:
+            logger.error(f"Error initializing microphone: {str(e)}")
+            QMessageBox.warning(self, "Microphone Error", f"Could not open microphone: {str(e)}")
+    
     def adjust_microphone(self):
-        """Adjust microphone for ambient noise"""
+        """Load the cached energy threshold, or calibrate in the background if there is none"""
         try:
-            with self.microphone as source:
-                self.recognizer.adjust_for_ambient_noise(source, duration=1)
-            logger.info("Microphone adjusted for ambient noise")
+            self.microphone_key = self.calibration_cache.device_key()
+            threshold = self.calibration_cache.get(self.microphone_key)
+            if threshold is not None:
+                self.recognizer.energy_threshold = threshold
+                logger.info(f"Loaded cached energy threshold {threshold:.1f} for {self.microphone_key}")
+                return
+            
+            # The calibration holds the microphone, so track it like a capture
+            worker = MicrophoneCalibrationWorker(self.recognizer, self.microphone)
+            worker.calibrated.connect(self.on_microphone_calibrated)
+            worker.failed.connect(
+                lambda error: QMessageBox.warning(self, "Microphone Error", f"Could not adjust microphone: {error}"))
+            self.capture_worker = worker
+            worker.start()
         except Exception as e:
             logger.error(f"Error adjusting microphone: {str(e)}")
             QMessageBox.warning(self, "Microphone Error", f"Could not adjust microphone: {str(e)}")
     
-    def load_classes(self):
-        """Load classes from MongoDB and populate dropdowns"""
+    def on_microphone_calibrated(self, threshold):
+        """Persist a freshly measured energy threshold"""
+        self.calibration_cache.set(self.microphone_key, threshold)
+        self.calibration_cache.save()
+        logger.info(f"Microphone adjusted for ambient noise: energy threshold {threshold:.1f}")
+    
+    def on_audio_captured(self, audio):
+        """Adapt the energy threshold to the noise floor of a captured segment"""
+        try:
+            samples, sample_rate = audio_data_to_samples(audio)
+            threshold = MicrophoneCalibrationCache.adapt(
+                self.recognizer.energy_threshold, samples, sample_rate, self.recognizer.dynamic_energy_ratio)
+            self.recognizer.energy_threshold = threshold
+            self.calibration_cache.set(self.microphone_key, threshold)
+        except Exception as e:
+            logger.warning(f"Could not adapt energy threshold: {str(e)}")
+    
+    def load_classes(self, classes=None):
+        """Load classes from MongoDB (unless already fetched) and populate dropdowns"""
         try:
-            self.classes = list(self.classes_col.find({}))
+            self.classes = find_classes(self.db) if classes is None else classes
+            self.classes_by_id = {cls['_id']: cls for cls in self.classes}
             logger.info(f"Loaded {len(self.classes)} classes from database")
             
             # Clear and populate class combos
@@ -699,17 +1373,27 @@ class VoiceAttendanceSystem(QMainWindow):
             logger.error(f"Error loading classes: {str(e)}")
             QMessageBox.critical(self, "Error", f"Failed to load classes: {str(e)}")
     
+    def get_student_counts(self):
+        """Per-class and per-section enrollment counts from a single aggregation"""
+        if self.student_counts is None:
+            self.student_counts = student_counts(self.db)
+        return self.student_counts
+    
     def update_classes_table(self):
         """Update the classes table with current data"""
         try:
+            counts = self.get_student_counts()
             self.classes_table.setRowCount(len(self.classes))
             
             for row, cls in enumerate(self.classes):
-                # Count students in this class
-                student_count = self.students_col.count_documents({"class_id": cls['_id']})
+                student_count = counts['classes'].get(cls['_id'], 0)
+                sections = ", ".join(
+                    f"{section} ({counts['sections'].get((cls['_id'], section), 0)})"
+                    for section in cls['sections']
+                )
                 
                 self.classes_table.setItem(row, 0, QTableWidgetItem(cls['name']))
-                self.classes_table.setItem(row, 1, QTableWidgetItem(", ".join(cls['sections'])))
+                self.classes_table.setItem(row, 1, QTableWidgetItem(sections))
                 self.classes_table.setItem(row, 2, QTableWidgetItem(str(student_count)))
             
             self.classes_table.resizeColumnsToContents()
@@ -728,10 +1412,7 @@ class VoiceAttendanceSystem(QMainWindow):
                 return
                 
             # Load students from MongoDB
-            students = list(self.students_col.find({
-                "class_id": class_id,
-                "section": section
-            }))
+            students = find_students(self.db, class_id, section)
             logger.info(f"Loaded {len(students)} students for class {class_id} section {section}")
             
             # Update student combo
@@ -739,22 +1420,107 @@ class VoiceAttendanceSystem(QMainWindow):
             for student in students:
                 self.student_combo.addItem(f"{student['name']} ({student['student_id']})", student['student_id'])
             
+            # Restrict voice matching to this section's roster
+            self.section_key = (class_id, section)
+            self.section_student_ids = [student['student_id'] for student in students]
+            self.refresh_section_index()
+            self.load_marked_today()
+            
             # Update attendance table for this class/section
             self.update_attendance_table()
         except Exception as e:
             logger.error(f"Error loading class students: {str(e)}")
             QMessageBox.critical(self, "Error", f"Failed to load students: {str(e)}")
     
-    def load_enrolled_students(self):
-        """Load all enrolled students from MongoDB"""
+    def load_marked_today(self):
+        """Load the IDs of students already marked today in the active section"""
+        self.marked_today_date = session_date(datetime.datetime.now())
+        self.marked_today = set()
+        if self.section_key is None:
+            return
+        
+        class_id, section = self.section_key
+        self.marked_today = marked_student_ids(self.db, class_id, section, self.marked_today_date)
+    
+    def start_student_sync(self):
+        """Follow enrollments made at other stations"""
+        if self.sync_worker is not None:
+            return
+        sync = StudentSync(self.students_col, self.students, self.data_loaded_at)
+        self.sync_worker = StudentSyncWorker(sync)
+        self.sync_worker.changed.connect(self.on_students_changed)
+        self.sync_worker.start()
+    
+    def on_students_changed(self, changes):
+        """Patch the student list and voiceprint indexes in place with changes from other stations"""
         try:
-            self.students = list(self.students_col.find({}))
+            students = {student['student_id']: student for student in self.students}
+            voiceprints = []
+            removed = 0
+            touched = set()
+            for kind, change in changes:
+                if kind == "delete":
+                    self.voice_templates.discard(change)
+                    student = students.pop(change, None)
+                    removed += self.voice_index.remove(change)
+                else:
+                    student = {field: change.get(field) for field in STUDENT_FIELDS}
+                    students[student['student_id']] = student
+                    self.voice_templates.discard(student['student_id'])
+                    extractor = change.get('feature_extractor', StatsFeatureExtractor.name)
+                    if extractor == self.feature_extractor.name and 'voice_features' in change:
+                        if not self.voice_index.holds(student['student_id'], change['voice_features']):
+                            voiceprints.append((student['student_id'], change['voice_features']))
+                    else:
+                        # Waiting for migration to this station's extractor
+                        removed += self.voice_index.remove(student['student_id'])
+                if student is not None:
+                    touched.add((student['class_id'], student['section']))
+            
+            self.voice_index.add_many(voiceprints)
+            if voiceprints or removed:
+                # The local index no longer matches a saved store version
+                self.voiceprint_version = None
+                logger.info(f"Synced {len(voiceprints)} voiceprint updates and {removed} removals")
+            
+            self.students = list(students.values())
+            self.student_counts = None
+            self.update_classes_table()
+            self.update_enrolled_table()
+            if self.section_key in touched:
+                self.load_class_students()
+        except Exception as e:
+            logger.error(f"Error applying student changes: {str(e)}")
+    
+    def note_voiceprint_change(self):
+        """Advance the shared voiceprint version after this station wrote a voiceprint"""
+        version = bump_voiceprint_version(self.db)
+        if self.voiceprint_version is not None and version == self.voiceprint_version + 1:
+            # No other station wrote in between, so the local index is exactly this version
+            self.voiceprint_version = version
+            self.voiceprints_dirty = True
+        else:
+            self.voiceprint_version = None
+    
+    def refresh_section_index(self):
+        """Rebuild the active section's sub-index from the full voiceprint index"""
+        self.section_index = self.voice_index.subset(self.section_student_ids)
+        logger.info(f"Section index built with {len(self.section_index)} voiceprints")
+    
+    def load_enrolled_students(self, students=None, voiceprints=None):
+        """Load all enrolled students and their voiceprint index (unless already fetched)"""
+        try:
+            if students is None:
+                students = find_students(self.db)
+                self.migrate_voice_features(students)
+            if voiceprints is None:
+                voiceprints = self.voiceprint_store.open(self.db)
+            self.students = students
+            self.voice_index, self.voiceprint_version = voiceprints
+            self.voiceprints_dirty = False
             logger.info(f"Loaded {len(self.students)} enrolled students")
+            self.refresh_section_index()
             self.update_enrolled_table()
-            
-            # Also update class sections when class selection changes
-            self.enroll_class_combo.currentIndexChanged.connect(self.update_class_sections)
-            self.report_class_combo.currentIndexChanged.connect(self.update_report_sections)
         except Exception as e:
             logger.error(f"Error loading enrolled students: {str(e)}")
             QMessageBox.critical(self, "Error", f"Failed to load enrolled students: {str(e)}")
@@ -767,7 +1533,7 @@ class VoiceAttendanceSystem(QMainWindow):
                 return
                 
             # Find the class and get its sections
-            cls = next((c for c in self.classes if c['_id'] == class_id), None)
+            cls = self.classes_by_id.get(class_id)
             if cls:
                 self.enroll_section_combo.clear()
                 for section in cls['sections']:
@@ -785,7 +1551,7 @@ class VoiceAttendanceSystem(QMainWindow):
                 return
                 
             # Find the class and get its sections
-            cls = next((c for c in self.classes if c['_id'] == class_id), None)
+            cls = self.classes_by_id.get(class_id)
             if cls:
                 self.report_section_combo.clear()
                 self.report_section_combo.addItem("All")
@@ -796,6 +1562,11 @@ class VoiceAttendanceSystem(QMainWindow):
             logger.error(f"Error updating report sections: {str(e)}")
             raise
     
+    def get_class_name(self, class_id):
+        """Display name for a class ID"""
+        cls = self.classes_by_id.get(class_id)
+        return cls['name'] if cls else "Unknown"
+    
     def update_enrolled_table(self):
         """Update the enrolled students table"""
         try:
@@ -803,7 +1574,7 @@ class VoiceAttendanceSystem(QMainWindow):
             
             for row, student in enumerate(self.students):
                 # Get class name
-                class_name = next((c['name'] for c in self.classes if c['_id'] == student['class_id']), "Unknown")
+                class_name = self.get_class_name(student['class_id'])
                 
                 self.enrolled_table.setItem(row, 0, QTableWidgetItem(student['student_id']))
                 self.enrolled_table.setItem(row, 1, QTableWidgetItem(student['name']))
@@ -816,56 +1587,38 @@ class VoiceAttendanceSystem(QMainWindow):
             logger.error(f"Error updating enrolled students table: {str(e)}")
             raise
     
-    def extract_voice_features(self, audio_data):
-        """Extract simple features from audio data for comparison"""
+    def extract_voice_features(self, audio_data, sample_rate=16000):
+        """Extract a fixed-length voiceprint from audio data for comparison"""
         try:
-            features = {
-                'mean': np.mean(audio_data),
-                'std': np.std(audio_data),
-                'length': len(audio_data)
-            }
-            return features
+            return self.feature_extractor.extract(audio_data, sample_rate)
         except Exception as e:
             logger.error(f"Error extracting voice features: {str(e)}")
             raise
     
-    def compare_voices(self, audio_data):
-        """Compare new audio with enrolled samples"""
+    def migrate_voice_features(self, students):
+        """Re-extract voiceprints from enrollment WAVs for students enrolled with another extractor"""
+        migrate_voice_features(self.students_col, students, self.feature_extractor)
+    
+    def compare_voices(self, audio_data, sample_rate=16000, index=None):
+        """Compare new audio with enrolled samples, optionally within a sub-index"""
         try:
-            new_features = self.extract_voice_features(audio_data)
-            
-            best_match = None
-            best_score = -1
-            
-            # Compare with all enrolled samples
-            for student in self.students:
-                if 'voice_features' not in student:
-                    continue
-                    
-                # Get stored features
-                features = student['voice_features']
-                
-                # Calculate similarity
-                vec1 = np.array([features['mean'], features['std'], features['length']])
-                vec2 = np.array([new_features['mean'], new_features['std'], new_features['length']])
-                
-                vec1 = vec1.reshape(1, -1)
-                vec2 = vec2.reshape(1, -1)
-                
-                score = cosine_similarity(vec1, vec2)[0][0]
-                
-                if score > best_score:
-                    best_score = score
-                    best_match = student['student_id']
+            new_features = self.extract_voice_features(audio_data, sample_rate)
+            if index is None:
+                index = self.voice_index
             
-            logger.info(f"Best voice match: {best_match} with score: {best_score}")
-            
-            # Return match if score is above threshold
-            return (best_match, best_score) if best_score > 0.7 else (None, 0)
+            return match_voiceprint(index, new_features, self.feature_extractor.match_threshold, self.voice_templates)
         except Exception as e:
             logger.error(f"Error comparing voices: {str(e)}")
             return (None, 0)
     
+    def capture_in_progress(self):
+        """Check whether the microphone is currently in use by a capture worker"""
+        for worker in (self.capture_worker, self.roll_call_worker):
+            if worker is not None and worker.isRunning():
+                QMessageBox.information(self, "Busy", "A voice recording is already in progress")
+                return True
+        return False
+    
     def record_voice_sample(self):
         """Record voice sample for new student enrollment"""
         try:
@@ -884,128 +1637,293 @@ class VoiceAttendanceSystem(QMainWindow):
                 return
                 
             # Check if student ID already exists
-            if self.students_col.find_one({"student_id": student_id}):
+            if student_exists(self.db, student_id):
                 QMessageBox.warning(self, "Error", "Student ID already exists")
                 return
+            
+            self.ensure_audio()
+            if self.microphone is None or self.capture_in_progress():
+                return
                 
-            self.enroll_status.setText("Recording... Speak now")
             self.record_enroll_btn.setEnabled(False)
-            QApplication.processEvents()
-            
-            with self.microphone as source:
-                logger.info("Starting voice recording...")
-                audio = self.recognizer.listen(source, timeout=5)
-                logger.info("Voice recording completed")
-            
-            # Save the audio file
-            filename = f"{student_id}_{name.replace(' ', '_')}.wav"
+            self.enrollment = {
+                "name": name,
+                "student_id": student_id,
+                "class_id": class_id,
+                "section": section,
+                "paths": [],
+                "features": []
+            }
+            self.capture_enrollment_sample()
+        except Exception as e:
+            self.enrollment = None
+            self.on_enrollment_failed(str(e))
+            self.record_enroll_btn.setEnabled(True)
+    
+    def capture_enrollment_sample(self):
+        """Capture the next enrollment sample on a worker thread so the window stays responsive"""
+        number = len(self.enrollment['paths']) + 1
+        self.enroll_status.setText(f"Recording sample {number} of {self.enrollment_samples}... Speak now")
+        
+        worker = VoiceCaptureWorker(self.recognizer, self.microphone)
+        worker.captured.connect(self.on_audio_captured)
+        worker.captured.connect(self.on_enrollment_sample)
+        worker.timed_out.connect(self.on_enrollment_timeout)
+        worker.failed.connect(self.on_enrollment_failed)
+        worker.finished.connect(self.on_enrollment_capture_finished)
+        self.capture_worker = worker
+        worker.start()
+    
+    def on_enrollment_sample(self, audio):
+        """Save a captured sample and extract its features while the next one is recorded"""
+        try:
+            enrollment = self.enrollment
+            number = len(enrollment['paths']) + 1
+            filename = f"{enrollment['student_id']}_{enrollment['name'].replace(' ', '_')}_{number}.wav"
             filepath = os.path.join("enrollments", filename)
             
             with open(filepath, "wb") as f:
                 f.write(audio.get_wav_data())
+            enrollment['paths'].append(filepath)
             
-            # Extract features
-            audio_data, _ = sf.read(filepath)
-            features = self.extract_voice_features(audio_data)
+            # Extract features straight from the captured frames
+            audio_data, sample_rate = audio_data_to_samples(audio)
+            enrollment['features'].append(
+                self.extraction_pool.submit(self.extract_voice_features, audio_data, sample_rate))
+        except Exception as e:
+            self.on_enrollment_failed(str(e))
+    
+    def on_enrollment_capture_finished(self):
+        """Record the next sample, or register the student once every sample is in"""
+        enrollment = self.enrollment
+        if enrollment is not None and len(enrollment['paths']) < self.enrollment_samples:
+            self.capture_enrollment_sample()
+            return
+        
+        self.enrollment = None
+        self.record_enroll_btn.setEnabled(True)
+        if enrollment is not None:
+            self.complete_enrollment(enrollment)
+    
+    def complete_enrollment(self, enrollment):
+        """Aggregate the enrollment samples and register the student"""
+        stored = False
+        try:
+            name = enrollment['name']
+            student_id = enrollment['student_id']
+            class_id = enrollment['class_id']
+            section = enrollment['section']
+            templates = [future.result() for future in enrollment['features']]
             
-            # Save to MongoDB
+            # Save to MongoDB: a centroid for matching plus the per-sample templates for re-scoring
             student_data = {
                 "student_id": student_id,
                 "name": name,
                 "class_id": class_id,
                 "section": section,
-                "voice_features": features,
+                "feature_extractor": self.feature_extractor.name,
                 "enrollment_date": datetime.datetime.now(),
-                "voice_sample_path": filepath
+                "voice_sample_path": enrollment['paths'][0],
+                "voice_sample_paths": enrollment['paths'],
+                "updated_at": datetime.datetime.now()
             }
-            self.students_col.insert_one(student_data)
-            logger.info(f"Student {name} ({student_id}) enrolled successfully")
+            student_data.update(voiceprint_fields(templates))
+            features = student_data['voice_features']
+            insert_student(self.db, student_data)
+            stored = True
+            logger.info(f"Student {name} ({student_id}) enrolled successfully with {len(templates)} samples")
+            
+            # Keep the in-memory voiceprint index in sync without a full reload
+            self.students.append({field: student_data[field] for field in STUDENT_FIELDS})
+            self.voice_index.add(student_id, features)
+            self.voice_templates.preload({student_id: student_data.get('voice_templates')})
+            self.note_voiceprint_change()
+            if self.section_key == (class_id, section):
+                self.section_student_ids.append(student_id)
+                self.section_index.add(student_id, features)
             
             # Refresh UI
-            self.load_enrolled_students()
+            self.student_counts = None
+            self.update_classes_table()
+            self.update_enrolled_table()
             self.enroll_status.setText("Enrollment successful!")
             QMessageBox.information(self, "Success", f"Student {name} enrolled successfully")
             
             # Clear form
             self.enroll_name.clear()
             self.enroll_id.clear()
-            
-        except sr.WaitTimeoutError:
-            self.enroll_status.setText("Recording timeout")
-            QMessageBox.warning(self, "Timeout", "No speech detected during recording")
-            logger.warning("Voice recording timeout - no speech detected")
         except Exception as e:
-            self.enroll_status.setText("Recording failed")
-            QMessageBox.critical(self, "Error", f"Recording failed: {str(e)}")
-            logger.error(f"Error during voice enrollment: {str(e)}")
-        finally:
-            self.record_enroll_btn.setEnabled(True)
+            if not stored:
+                self.discard_enrollment_samples(enrollment)
+            self.on_enrollment_failed(str(e))
+    
+    def discard_enrollment_samples(self, enrollment):
+        """Delete the WAV files of an abandoned enrollment so bulk enrollment and migration never pick them up"""
+        if enrollment is None:
+            return
+        for path in enrollment['paths']:
+            try:
+                os.remove(path)
+            except OSError as e:
+                logger.warning(f"Could not delete enrollment sample {path}: {str(e)}")
+    
+    def on_enrollment_timeout(self):
+        """Handle an enrollment capture that heard no speech"""
+        self.discard_enrollment_samples(self.enrollment)
+        self.enrollment = None
+        self.enroll_status.setText("Recording timeout")
+        QMessageBox.warning(self, "Timeout", "No speech detected during recording")
+        logger.warning("Voice recording timeout - no speech detected")
+    
+    def on_enrollment_failed(self, error):
+        """Report a failed enrollment capture"""
+        self.discard_enrollment_samples(self.enrollment)
+        self.enrollment = None
+        self.enroll_status.setText("Recording failed")
+        QMessageBox.critical(self, "Error", f"Recording failed: {error}")
+        logger.error(f"Error during voice enrollment: {error}")
     
     def start_attendance(self):
         """Start voice attendance process"""
         try:
-            class_id = self.class_combo.currentData()
-            section = self.section_combo.currentText()
-            
-            if not class_id or not section:
+            class_id, section = self.attendance_scope()
+            if not self.kiosk and (not class_id or not section):
                 QMessageBox.warning(self, "Error", "Please select class and section")
                 return
+            
+            self.ensure_audio()
+            if self.microphone is None or self.capture_in_progress():
+                return
                 
             self.record_btn.setEnabled(False)
-            self.voice_status.setText("Listening for attendance...")
-            QApplication.processEvents()
-            
-            with self.microphone as source:
-                logger.info("Starting attendance recording...")
-                audio = self.recognizer.listen(source, timeout=5)
-                logger.info("Attendance recording completed")
-            
-            # Save temporary audio file
-            temp_file = "temp_attendance.wav"
-            with open(temp_file, "wb") as f:
-                f.write(audio.get_wav_data())
+            self.voice_status.setText("Opening microphone...")
+            
+            # Capture and match on a worker thread; the write happens on the attendance writer,
+            # so the next capture can start as soon as this one has been matched
+            worker = VoiceCaptureWorker(self.recognizer, self.microphone, self.identify_speaker)
+            worker.listening.connect(lambda: self.voice_status.setText("Listening for attendance..."))
+            worker.captured.connect(self.on_audio_captured)
+            worker.matched.connect(
+                lambda student, score: self.on_voice_matched(student, score, class_id, section))
+            worker.no_match.connect(self.on_voice_no_match)
+            worker.timed_out.connect(self.on_attendance_timeout)
+            worker.failed.connect(self.on_attendance_failed)
+            worker.finished.connect(lambda: self.record_btn.setEnabled(True))
+            self.capture_worker = worker
+            worker.start()
+        except Exception as e:
+            self.on_attendance_failed(str(e))
+            self.record_btn.setEnabled(True)
+    
+    def attendance_scope(self):
+        """Class and section attendance is marked under, or (None, None) in kiosk mode"""
+        if self.kiosk:
+            return None, None
+        return self.class_combo.currentData(), self.section_combo.currentText()
+    
+    def identify_speaker(self, audio):
+        """Match captured audio against the active section or campus (runs on the capture thread)"""
+        audio_data, sample_rate = audio_data_to_samples(audio)
+        return self.match_samples(audio_data, sample_rate)
+    
+    def match_samples(self, audio_data, sample_rate):
+        """Match decoded samples against the active section (every student in kiosk mode) and look up the student"""
+        index = self.voice_index if self.kiosk else self.section_index
+        student_id, score = self.compare_voices(audio_data, sample_rate, index)
+        if not student_id:
+            return None, score
+        
+        # Get student details
+        student = find_student(self.db, student_id)
+        if not student:
+            logger.warning(f"Student ID {student_id} not found in database")
+        return student, score
+    
+    def toggle_roll_call(self):
+        """Start or stop continuous roll call for the selected class/section"""
+        try:
+            if self.roll_call_worker is not None and self.roll_call_worker.isRunning():
+                self.roll_call_worker.stop()
+                self.roll_call_btn.setEnabled(False)
+                self.voice_status.setText("Stopping roll call...")
+                return
             
-            # Load audio data
-            audio_data, _ = sf.read(temp_file)
-            
-            # Compare with enrolled voices
-            student_id, score = self.compare_voices(audio_data)
-            
-            if student_id:
-                # Get student details
-                student = self.students_col.find_one({"student_id": student_id})
-                if student:
-                    current_time = datetime.datetime.now()
-                    self.mark_attendance(
-                        student_id, 
-                        student['name'], 
-                        class_id, 
-                        section, 
-                        current_time, 
-                        "Present (Voice)"
-                    )
-                    self.voice_status.setText(f"Attendance marked for {student['name']}")
-                    logger.info(f"Attendance marked for {student['name']} ({student_id})")
-                else:
-                    self.voice_status.setText("Student not found in database")
-                    logger.warning(f"Student ID {student_id} not found in database")
-            else:
-                self.voice_status.setText("No matching voice found")
-                logger.warning("No matching voice found for attendance")
+            class_id, section = self.attendance_scope()
+            if not self.kiosk and (not class_id or not section):
+                QMessageBox.warning(self, "Error", "Please select class and section")
+                return
             
-            # Remove temporary file
-            os.remove(temp_file)
+            if self.capture_in_progress():
+                return
             
-        except sr.WaitTimeoutError:
-            self.voice_status.setText("No speech detected")
-            QMessageBox.warning(self, "Timeout", "No speech detected during attendance")
-            logger.warning("Attendance recording timeout - no speech detected")
+            self.roll_call_marked = set()
+            worker = RollCallWorker(self.match_samples)
+            worker.listening.connect(
+                lambda: self.voice_status.setText("Roll call running - students may speak in turn"))
+            worker.matched.connect(
+                lambda student, score: self.on_roll_call_matched(student, score, class_id, section))
+            worker.no_match.connect(self.on_voice_no_match)
+            worker.failed.connect(self.on_attendance_failed)
+            worker.finished.connect(self.on_roll_call_finished)
+            
+            # Lock the section for the whole session
+            self.record_btn.setEnabled(False)
+            self.class_combo.setEnabled(False)
+            self.section_combo.setEnabled(False)
+            self.roll_call_btn.setText("Stop Roll Call")
+            self.voice_status.setText("Opening microphone...")
+            self.roll_call_worker = worker
+            worker.start()
         except Exception as e:
-            self.voice_status.setText(f"Error: {str(e)}")
-            QMessageBox.critical(self, "Error", f"Attendance failed: {str(e)}")
-            logger.error(f"Error during voice attendance: {str(e)}")
-        finally:
-            self.record_btn.setEnabled(True)
+            self.on_attendance_failed(str(e))
+    
+    def on_roll_call_matched(self, student, score, class_id, section):
+        """Mark a roll call match once per session, ignoring repeats"""
+        if student['student_id'] in self.roll_call_marked:
+            return
+        self.roll_call_marked.add(student['student_id'])
+        self.on_voice_matched(student, score, class_id, section, quiet=True)
+    
+    def on_roll_call_finished(self):
+        """Restore the attendance controls after roll call stops"""
+        self.record_btn.setEnabled(True)
+        self.class_combo.setEnabled(True)
+        self.section_combo.setEnabled(True)
+        self.roll_call_btn.setEnabled(True)
+        self.roll_call_btn.setText("Start Continuous Roll Call")
+        self.voice_status.setText(f"Roll call finished: {len(self.roll_call_marked)} students marked")
+        logger.info(f"Roll call finished with {len(self.roll_call_marked)} students marked")
+    
+    def on_voice_matched(self, student, score, class_id, section, quiet=False):
+        """Mark attendance for a student identified by voice"""
+        self.voice_status.setText(f"Matched {student['name']} (score {score:.2f})")
+        self.mark_attendance(
+            student['student_id'],
+            student['name'],
+            class_id or student['class_id'],
+            section or student['section'],
+            datetime.datetime.now(),
+            "Present (Voice)",
+            quiet
+        )
+        logger.info(f"Voice matched {student['name']} ({student['student_id']})")
+    
+    def on_voice_no_match(self, message):
+        """Report an utterance that matched no enrolled voice"""
+        self.voice_status.setText(message)
+        logger.warning("No matching voice found for attendance")
+    
+    def on_attendance_timeout(self):
+        """Handle an attendance capture that heard no speech"""
+        self.voice_status.setText("No speech detected")
+        QMessageBox.warning(self, "Timeout", "No speech detected during attendance")
+        logger.warning("Attendance recording timeout - no speech detected")
+    
+    def on_attendance_failed(self, error):
+        """Report a failed attendance capture"""
+        self.voice_status.setText(f"Error: {error}")
+        QMessageBox.critical(self, "Error", f"Attendance failed: {error}")
+        logger.error(f"Error during voice attendance: {error}")
     
     def mark_manual_attendance(self):
         """Mark attendance manually for selected student"""
@@ -1015,7 +1933,7 @@ class VoiceAttendanceSystem(QMainWindow):
                 return
                 
             # Get student details
-            student = self.students_col.find_one({"student_id": student_id})
+            student = find_student(self.db, student_id)
             if not student:
                 QMessageBox.warning(self, "Error", "Student not found")
                 return
@@ -1037,74 +1955,63 @@ class VoiceAttendanceSystem(QMainWindow):
             logger.error(f"Error marking manual attendance: {str(e)}")
             QMessageBox.critical(self, "Error", f"Failed to mark attendance: {str(e)}")
     
-    def mark_attendance(self, student_id, name, class_id, section, time, status):
-        """Mark attendance in database and update UI"""
+    def mark_attendance(self, student_id, name, class_id, section, time, status, quiet=False):
+        """Queue an attendance record for the background writer; quiet reports repeats in the status line"""
         try:
-            # Check if already marked today
-            today = datetime.datetime.combine(time.date(), datetime.time.min)
-            existing = self.attendance_col.find_one({
-                "student_id": student_id,
-                "date": {"$gte": today}
-            })
-            
-            if existing:
-                QMessageBox.information(self, "Info", f"{name} is already marked present today")
-                logger.info(f"Attendance already marked today for {name} ({student_id})")
-                return
-                
-            # Insert attendance record
-            attendance_record = {
-                "student_id": student_id,
-                "name": name,
-                "class_id": class_id,
-                "section": section,
-                "date": time,
-                "status": status,
-                "timestamp": datetime.datetime.now()
-            }
-            self.attendance_col.insert_one(attendance_record)
-            logger.info(f"Attendance recorded for {name} ({student_id})")
+            # Check if already marked today, from memory for the active section
+            if session_date(time) != self.marked_today_date:
+                self.load_marked_today()
+            if (class_id, section) == self.section_key:
+                if student_id in self.marked_today:
+                    if quiet:
+                        self.voice_status.setText(f"{name} is already marked present today")
+                    else:
+                        QMessageBox.information(self, "Info", f"{name} is already marked present today")
+                    logger.info(f"Attendance already marked today for {name} ({student_id})")
+                    return
+                self.marked_today.add(student_id)
             
-            # Update attendance table
-            self.update_attendance_table()
+            self.attendance_writer.submit(attendance_record(student_id, name, class_id, section, time, status))
         except Exception as e:
             logger.error(f"Error marking attendance: {str(e)}")
             QMessageBox.critical(self, "Error", f"Failed to mark attendance: {str(e)}")
     
+    def on_attendance_written(self, record):
+        """Refresh the view after the writer stored a record"""
+        logger.info(f"Attendance recorded for {record['name']} ({record['student_id']})")
+        if (record['class_id'], record['section']) == self.section_key:
+            self.attendance_model.add_record(record)
+    
+    def on_attendance_duplicate(self, record):
+        """Tell the user a student was already marked today"""
+        if self.roll_call_worker is not None and self.roll_call_worker.isRunning():
+            # Don't interrupt roll call with a modal box
+            self.voice_status.setText(f"{record['name']} is already marked present today")
+        else:
+            QMessageBox.information(self, "Info", f"{record['name']} is already marked present today")
+        logger.info(f"Attendance already marked today for {record['name']} ({record['student_id']})")
+    
+    def on_attendance_write_failed(self, record, error):
+        """Report a record the writer could not store"""
+        if (record['class_id'], record['section']) == self.section_key:
+            self.marked_today.discard(record['student_id'])
+        QMessageBox.critical(self, "Error", f"Failed to mark attendance for {record['name']}: {error}")
+    
     def update_attendance_table(self):
-        """Update the attendance table with today's records"""
+        """Reload the attendance table with today's records for the selected section"""
         try:
-            today = datetime.datetime.combine(datetime.datetime.now().date(), datetime.time.min)
-            
             # Get current selections
             class_id = self.class_combo.currentData()
             section = self.section_combo.currentText()
             
             if not class_id or not section:
-                self.attendance_table.setRowCount(0)
+                self.attendance_model.set_records([], "")
                 return
             
-            query = {
-                "date": {"$gte": today},
-                "class_id": class_id,
-                "section": section
-            }
-            
-            attendance = list(self.attendance_col.find(query).sort("date", -1))
+            attendance = section_attendance(self.db, class_id, section, session_date(datetime.datetime.now()))
             logger.info(f"Found {len(attendance)} attendance records for display")
             
-            self.attendance_table.setRowCount(len(attendance))
-            
-            for row, record in enumerate(attendance):
-                # Get class name
-                class_name = self.class_combo.currentText()
-                
-                self.attendance_table.setItem(row, 0, QTableWidgetItem(record['student_id']))
-                self.attendance_table.setItem(row, 1, QTableWidgetItem(record['name']))
-                self.attendance_table.setItem(row, 2, QTableWidgetItem(class_name))
-                self.attendance_table.setItem(row, 3, QTableWidgetItem(record['date'].strftime("%Y-%m-%d %H:%M:%S")))
-                self.attendance_table.setItem(row, 4, QTableWidgetItem(record['status']))
-            
+            self.attendance_model.set_records(attendance, self.class_combo.currentText())
             self.attendance_table.resizeColumnsToContents()
         except Exception as e:
             logger.error(f"Error updating attendance table: {str(e)}")
@@ -1124,18 +2031,10 @@ class VoiceAttendanceSystem(QMainWindow):
                 QMessageBox.warning(self, "Error", "Please provide at least one section")
                 return
                 
-            # Check if class already exists
-            if self.classes_col.find_one({"name": name}):
+            # Insert new class unless the name is taken
+            if add_class(self.db, name, sections) is None:
                 QMessageBox.warning(self, "Error", "Class already exists")
                 return
-                
-            # Insert new class
-            class_data = {
-                "name": name,
-                "sections": sections,
-                "created_at": datetime.datetime.now()
-            }
-            self.classes_col.insert_one(class_data)
             logger.info(f"New class added: {name} with sections: {sections}")
             
             # Refresh UI
@@ -1156,55 +2055,133 @@ class VoiceAttendanceSystem(QMainWindow):
             start_date = self.report_start_date.text().strip()
             end_date = self.report_end_date.text().strip()
             
-            # Build query
-            query = {}
-            if class_id:
-                query["class_id"] = class_id
-            if section:
-                query["section"] = section
-            
             # Date range
             try:
-                if start_date:
-                    start = datetime.datetime.strptime(start_date, "%Y-%m-%d")
-                    query["date"] = {"$gte": start}
-                if end_date:
-                    end = datetime.datetime.strptime(end_date, "%Y-%m-%d") + datetime.timedelta(days=1)
-                    if "date" in query:
-                        query["date"]["$lt"] = end
-                    else:
-                        query["date"] = {"$lt": end}
+                start = datetime.datetime.strptime(start_date, "%Y-%m-%d") if start_date else None
+                end = datetime.datetime.strptime(end_date, "%Y-%m-%d") if end_date else None
             except ValueError:
                 QMessageBox.warning(self, "Error", "Invalid date format. Use YYYY-MM-DD")
                 return
+            query = attendance_query(class_id, section, start, end)
                 
-            # Get attendance records
-            records = list(self.attendance_col.find(query).sort("date", -1))
-            logger.info(f"Generated report with {len(records)} records")
-            
-            # Update report table
-            self.report_table.setRowCount(len(records))
-            
-            for row, record in enumerate(records):
-                # Get class name
-                class_name = next((c['name'] for c in self.classes if c['_id'] == record['class_id']), "Unknown")
+            mode = self.report_type_combo.currentText()
+            if mode != "Attendance Records":
+                # Summaries are aggregated by MongoDB in the background
+                self.generate_report_btn.setEnabled(False)
+                self.summary_task = BackgroundTask(self.build_summary_report, mode, query)
+                self.summary_task.done.connect(self.on_summary_report_ready)
+                self.summary_task.failed.connect(
+                    lambda error: QMessageBox.critical(self, "Error", f"Failed to generate report: {error}"))
+                self.summary_task.finished.connect(lambda: self.generate_report_btn.setEnabled(True))
+                self.summary_task.start()
+                return
                 
-                self.report_table.setItem(row, 0, QTableWidgetItem(record['date'].strftime("%Y-%m-%d")))
-                self.report_table.setItem(row, 1, QTableWidgetItem(class_name))
-                self.report_table.setItem(row, 2, QTableWidgetItem(record['section']))
-                self.report_table.setItem(row, 3, QTableWidgetItem(record['student_id']))
-                self.report_table.setItem(row, 4, QTableWidgetItem(record['name']))
-                self.report_table.setItem(row, 5, QTableWidgetItem(record['status']))
+            # Open the report cursor; further rows are fetched as the view scrolls
+            self.report_table.setModel(self.report_model)
+            self.report_model.set_query(self.attendance_col, query)
+            logger.info(f"Generated report, first {self.report_model.rowCount()} records fetched")
             
             self.report_table.resizeColumnsToContents()
         except Exception as e:
             logger.error(f"Error generating report: {str(e)}")
             QMessageBox.critical(self, "Error", f"Failed to generate report: {str(e)}")
     
+    def build_summary_report(self, mode, query):
+        """Compute a summary report's headers and rows (runs on a background thread)"""
+        if mode == "Daily Totals":
+            headers, rows = daily_totals_rows(self.summary_col, query, self.get_class_name)
+        else:
+            # Enrolled students who never attended still belong in the summary
+            roster = filter_roster(self.students, query)
+            if mode == "Student Summary":
+                headers, rows = student_summary_rows(self.attendance_col, query, roster, self.get_class_name)
+            else:
+                headers, rows = presence_matrix_rows(self.attendance_col, query, roster, self.get_class_name)
+        
+        logger.info(f"Generated {mode.lower()} with {len(rows)} rows")
+        return headers, rows
+    
+    def on_report_sort_changed(self, column, order):
+        """Put the sort indicator back when a column that cannot be sorted is clicked"""
+        if self.report_table.model() is not self.report_model or self.report_model.sortable(column):
+            return
+        header = self.report_table.horizontalHeader()
+        # Without blocking, restoring the indicator would re-run the report query
+        header.blockSignals(True)
+        header.setSortIndicator(*self.report_model.sort_indicator())
+        header.blockSignals(False)
+    
+    def on_report_fetch_failed(self, error):
+        """Tell the user a report stopped loading part-way"""
+        QMessageBox.warning(self, "Report Incomplete",
+                            f"Could not load more report rows: {error}\nGenerate the report again to retry.")
+    
+    def on_summary_report_ready(self, result):
+        """Show a computed summary report"""
+        headers, rows = result
+        self.summary_model.set_rows(headers, rows)
+        self.report_table.setModel(self.summary_model)
+        self.report_table.resizeColumnsToContents()
+    
+    def ask_export_path(self, title, filename):
+        """Ask where to save an export, defaulting to .xlsx"""
+        filepath, selected_filter = QFileDialog.getSaveFileName(
+            self, title, filename, "Excel Files (*.xlsx);;CSV Files (*.csv)")
+        if filepath and not filepath.lower().endswith(('.xlsx', '.csv')):
+            filepath += '.csv' if selected_filter.startswith("CSV") else '.xlsx'
+        return filepath
+    
+    def start_export(self, query, sort, projection, headers, row_fn, filepath):
+        """Stream a query to a file on a background thread with progress reporting"""
+        if self.export_worker is not None and self.export_worker.isRunning():
+            QMessageBox.information(self, "Busy", "An export is already in progress")
+            return
+        
+        worker = ExportWorker(self.attendance_col, query, sort, projection, headers, row_fn, filepath)
+        worker.progress.connect(self.on_export_progress)
+        worker.completed.connect(self.on_export_completed)
+        worker.failed.connect(self.on_export_failed)
+        worker.finished.connect(lambda: self.export_progress.hide())
+        worker.finished.connect(lambda: self.export_btn.setEnabled(True))
+        worker.finished.connect(lambda: self.export_report_btn.setEnabled(True))
+        
+        self.export_btn.setEnabled(False)
+        self.export_report_btn.setEnabled(False)
+        self.export_progress.setRange(0, 0)
+        self.export_progress.show()
+        self.export_worker = worker
+        worker.start()
+    
+    def on_export_progress(self, count, total):
+        """Update the export progress bar"""
+        self.export_progress.setRange(0, max(total, count))
+        self.export_progress.setValue(count)
+    
+    def on_export_completed(self, filepath, count):
+        """Report a finished export"""
+        logger.info(f"Exported {count} records to {filepath}")
+        QMessageBox.information(self, "Success", f"Exported {count} records to {filepath}")
+    
+    def on_export_failed(self, error):
+        """Report a failed export"""
+        QMessageBox.critical(self, "Error", f"Failed to export: {error}")
+    
+    def export_summary(self, filepath):
+        """Write the compact summary report that is already in memory"""
+        if self.export_worker is not None and self.export_worker.isRunning():
+            QMessageBox.information(self, "Busy", "An export is already in progress")
+            return
+        
+        task = BackgroundTask(write_rows, filepath, self.summary_model.headers, list(self.summary_model.rows))
+        task.done.connect(lambda count: self.on_export_completed(filepath, count))
+        task.failed.connect(self.on_export_failed)
+        self.export_worker = task
+        task.start()
+    
     def export_report(self):
-        """Export the current report to Excel"""
+        """Export the current report straight from the database"""
         try:
-            if self.report_table.rowCount() == 0:
+            if self.report_table.model().rowCount() == 0:
                 QMessageBox.warning(self, "Error", "No data to export")
                 return
                 
@@ -1215,69 +2192,41 @@ class VoiceAttendanceSystem(QMainWindow):
             end_date = self.report_end_date.text() or start_date
             
             filename = f"attendance_report_{class_name}_{section}_{start_date}_to_{end_date}.xlsx"
-            filepath, _ = QFileDialog.getSaveFileName(
-                self, "Save Report", filename, "Excel Files (*.xlsx)")
-            
-            if filepath:
-                if not filepath.endswith('.xlsx'):
-                    filepath += '.xlsx'
-                
-                # Prepare data for export
-                data = []
-                for row in range(self.report_table.rowCount()):
-                    row_data = []
-                    for col in range(self.report_table.columnCount()):
-                        item = self.report_table.item(row, col)
-                        row_data.append(item.text() if item else "")
-                    data.append(row_data)
-                
-                # Create DataFrame
-                columns = ["Date", "Class", "Section", "Student ID", "Name", "Status"]
-                df = pd.DataFrame(data, columns=columns)
-                
-                # Export to Excel
-                df.to_excel(filepath, index=False)
-                logger.info(f"Report exported to {filepath}")
-                QMessageBox.information(self, "Success", f"Report exported to {filepath}")
+            filepath = self.ask_export_path("Save Report", filename)
+            
+            if filepath and self.report_table.model() is self.summary_model:
+                self.export_summary(filepath)
+            elif filepath:
+                model = self.report_model
+                self.start_export(model.query, model.sort_spec(), model.projection(),
+                                  ReportTableModel.headers, model.format_record, filepath)
         except Exception as e:
             logger.error(f"Error exporting report: {str(e)}")
             QMessageBox.critical(self, "Error", f"Failed to export report: {str(e)}")
     
     def export_to_excel(self):
-        """Export current attendance view to Excel"""
+        """Export today's attendance for the selected section straight from the database"""
         try:
-            if self.attendance_table.rowCount() == 0:
+            if self.attendance_model.rowCount() == 0:
                 QMessageBox.warning(self, "Error", "No attendance data to export")
                 return
                 
             # Get class and section for filename
+            class_id = self.class_combo.currentData()
             class_name = self.class_combo.currentText() or "unknown_class"
             section = self.section_combo.currentText() or "unknown_section"
             filename = f"attendance_{class_name}_{section}_{datetime.datetime.now().date()}.xlsx"
-            filepath, _ = QFileDialog.getSaveFileName(
-                self, "Save Attendance", filename, "Excel Files (*.xlsx)")
+            filepath = self.ask_export_path("Save Attendance", filename)
             
             if filepath:
-                if not filepath.endswith('.xlsx'):
-                    filepath += '.xlsx'
-                
-                # Prepare data for export
-                data = []
-                for row in range(self.attendance_table.rowCount()):
-                    row_data = []
-                    for col in range(self.attendance_table.columnCount()):
-                        item = self.attendance_table.item(row, col)
-                        row_data.append(item.text() if item else "")
-                    data.append(row_data)
-                
-                # Create DataFrame
-                columns = ["ID", "Name", "Class", "Time", "Status"]
-                df = pd.DataFrame(data, columns=columns)
-                
-                # Export to Excel
-                df.to_excel(filepath, index=False)
-                logger.info(f"Attendance exported to {filepath}")
-                QMessageBox.information(self, "Success", f"Attendance exported to {filepath}")
+                query = {
+                    "date": {"$gte": session_date(datetime.datetime.now())},
+                    "class_id": class_id,
+                    "section": section
+                }
+                projection = {"student_id": 1, "name": 1, "date": 1, "status": 1, "_id": 0}
+                self.start_export(query, [("date", -1)], projection, AttendanceTableModel.headers,
+                                  lambda record: AttendanceTableModel.format_record(record, class_name), filepath)
         except Exception as e:
             logger.error(f"Error exporting attendance: {str(e)}")
             QMessageBox.critical(self, "Error", f"Failed to export attendance: {str(e)}")
@@ -1291,22 +2240,14 @@ class VoiceAttendanceSystem(QMainWindow):
                 QMessageBox.Yes | QMessageBox.No, QMessageBox.No)
             
             if reply == QMessageBox.Yes:
-                today = datetime.datetime.combine(datetime.datetime.now().date(), datetime.time.min)
                 class_id = self.class_combo.currentData()
                 section = self.section_combo.currentText()
                 
-                query = {
-                    "date": {"$gte": today},
-                    "class_id": class_id
-                }
-                
-                if section:
-                    query["section"] = section
-                    
-                # Delete records
-                result = self.attendance_col.delete_many(query)
-                logger.info(f"Cleared {result.deleted_count} attendance records")
-                QMessageBox.information(self, "Cleared", f"Deleted {result.deleted_count} attendance records")
+                # Delete records and their daily rollup
+                deleted = delete_attendance(self.db, class_id, section, session_date(datetime.datetime.now()))
+                logger.info(f"Cleared {deleted} attendance records")
+                QMessageBox.information(self, "Cleared", f"Deleted {deleted} attendance records")
+                self.load_marked_today()
                 
                 # Refresh table
                 self.update_attendance_table()
@@ -1314,9 +2255,36 @@ class VoiceAttendanceSystem(QMainWindow):
             logger.error(f"Error clearing attendance: {str(e)}")
             QMessageBox.critical(self, "Error", f"Failed to clear attendance: {str(e)}")
 
+    def closeEvent(self, event):
+        """Let background threads finish before the window closes"""
+        for task in (self.db_task, self.data_task, getattr(self, 'export_worker', None),
+                     getattr(self, 'summary_task', None)):
+            if task is not None:
+                task.wait()
+        if self.capture_worker is not None:
+            self.capture_worker.wait()
+        if self.roll_call_worker is not None:
+            self.roll_call_worker.stop()
+            self.roll_call_worker.wait()
+        if self.attendance_writer is not None:
+            self.attendance_writer.stop()
+        if self.sync_worker is not None:
+            self.sync_worker.stop()
+        self.extraction_pool.shutdown(wait=False)
+        if self.microphone_key is not None:
+            self.calibration_cache.save()
+        if self.voiceprints_dirty and self.voiceprint_version is not None:
+            self.voiceprint_store.save(self.voice_index, self.voiceprint_version)
+        super().closeEvent(event)
+
 if __name__ == "__main__":
+    parser = build_parser()
+    args, qt_args = parser.parse_known_args()
+    if has_command(args):
+        sys.exit(run_command_line(args))
+    
     try:
-        app = QApplication(sys.argv)
+        app = QApplication(sys.argv[:1] + qt_args)
         app.setStyle("Fusion")
         
         # Check if admin credentials are set
@@ -0,0 +1,18 @@
+"""Voice attendance core: feature extraction, matching, storage and reports without the desktop UI"""
+from .lazy import LazyModule
+from .features import (FeatureExtractor, StatsFeatureExtractor, MFCCFeatureExtractor, NormalizedMFCCFeatureExtractor,
+                       FEATURE_EXTRACTORS, get_feature_extractor, audio_data_to_samples)
+from .matching import (VoiceprintIndex, IVFVoiceprintIndex, VOICE_INDEXES, UtteranceSegmenter, match_voiceprint,
+                       rescore_with_templates, voiceprint_centroid, create_voiceprint_index)
+from .calibration import MicrophoneCalibrationCache
+from .repository import (DATABASE_NAME, STUDENT_FIELDS, get_mongo_client, ensure_indexes, voiceprint_version,
+                         bump_voiceprint_version, session_date, record_daily_summary, rebuild_daily_summary,
+                         repair_daily_summary, voiceprint_fields, migrate_voice_features, find_classes, find_class,
+                         add_class, find_students, find_student, student_exists, insert_student, student_counts,
+                         attendance_record, write_attendance, section_attendance, marked_student_ids,
+                         delete_attendance)
+from .store import VoiceprintStore, VoiceTemplateCache
+from .sync import StudentSync
+from .reports import (attendance_query, attendance_cursor, export_attendance, day_projection, attendance_summary, presence_matrix, write_rows, filter_roster,
+                      daily_totals_rows, student_summary_rows, presence_matrix_rows)
+from .batch import read_roster, bulk_enroll, batch_attendance
@@ -0,0 +1,195 @@
+"""Headless bulk enrollment and batch attendance from recordings"""
+import os
+import csv
+import datetime
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from pymongo.errors import BulkWriteError
+
+from .lazy import sf, openpyxl
+from .features import get_feature_extractor
+from .matching import VoiceprintIndex, UtteranceSegmenter, match_voiceprint
+from .repository import (bump_voiceprint_version, voiceprint_fields, find_classes, find_class, attendance_record,
+                         write_attendance)
+from .store import VoiceTemplateCache
+
+logger = logging.getLogger(__name__)
+
+ROSTER_COLUMNS = {"id": "id", "student id": "id", "student_id": "id", "name": "name",
+                  "class": "class", "section": "section"}
+
+def roster_value(value):
+    """Normalise a roster cell to a string, keeping spreadsheet integers integral"""
+    if value is None:
+        return ""
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return str(value).strip()
+
+def read_roster(path):
+    """Read roster rows with id, name and optional class/section from a CSV or XLSX file"""
+    if path.lower().endswith(".csv"):
+        with open(path, newline="", encoding="utf-8-sig") as f:
+            rows = list(csv.reader(f))
+    else:
+        workbook = openpyxl.load_workbook(path, read_only=True)
+        rows = list(workbook.active.iter_rows(values_only=True))
+        workbook.close()
+    
+    if not rows:
+        return []
+    columns = [ROSTER_COLUMNS.get(roster_value(cell).lower()) for cell in rows[0]]
+    if "id" not in columns or "name" not in columns:
+        raise ValueError(f"Roster {path} needs ID and Name columns")
+    
+    roster = []
+    for row in rows[1:]:
+        entry = {column: roster_value(cell) for column, cell in zip(columns, row) if column}
+        if entry.get("id"):
+            roster.append(entry)
+    return roster
+
+_pool_extractors = {}
+
+def pool_extractor(extractor_name):
+    """Feature extractor reused across tasks within a pool worker process"""
+    if extractor_name not in _pool_extractors:
+        _pool_extractors[extractor_name] = get_feature_extractor(extractor_name)
+    return _pool_extractors[extractor_name]
+
+def extract_file_features(filepath, extractor_name):
+    """Read a WAV file and return its voiceprint as a list (process pool worker)"""
+    audio_data, sample_rate = sf.read(filepath)
+    return pool_extractor(extractor_name).extract(audio_data, sample_rate).tolist()
+
+def extract_segment_features(audio_data, sample_rate, extractor_name):
+    """Voiceprint for one segmented utterance (process pool worker)"""
+    return pool_extractor(extractor_name).extract(audio_data, sample_rate)
+
+def bulk_enroll(db, roster_path, wav_dir, class_name=None, section=None, extractor_name=None, workers=None):
+    """Enroll a roster from <id>_<name>[_<n>].wav files; returns (enrolled count, [(student_id, reason)])"""
+    extractor_name = extractor_name or get_feature_extractor().name
+    roster = read_roster(roster_path)
+    classes = {cls['name']: cls for cls in find_classes(db)}
+    
+    # Enrollment samples follow the same naming scheme as enrollments/, one or more per student
+    wav_files = {}
+    for filename in sorted(os.listdir(wav_dir)):
+        if filename.lower().endswith(".wav"):
+            wav_files.setdefault(filename.split("_", 1)[0], []).append(os.path.join(wav_dir, filename))
+    
+    existing = set(db["students"].distinct("student_id", {"student_id": {"$in": [r['id'] for r in roster]}}))
+    
+    failures = []
+    jobs = []
+    for entry in roster:
+        student_id = entry['id']
+        cls = classes.get(entry.get('class') or class_name)
+        student_section = entry.get('section') or section
+        if not student_id.isalnum():
+            failures.append((student_id, "Student ID should be alphanumeric"))
+        elif not entry.get('name'):
+            failures.append((student_id, "Missing name"))
+        elif student_id in existing:
+            failures.append((student_id, "Student ID already exists"))
+        elif cls is None:
+            failures.append((student_id, f"Unknown class: {entry.get('class') or class_name}"))
+        elif student_section not in cls['sections']:
+            failures.append((student_id, f"Unknown section {student_section} for class {cls['name']}"))
+        elif student_id not in wav_files:
+            failures.append((student_id, "No voice sample found"))
+        else:
+            jobs.append((entry, cls['_id'], student_section, wav_files[student_id]))
+    
+    # Feature extraction is CPU bound, so spread every sample of every student across processes
+    students = []
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [[executor.submit(extract_file_features, filepath, extractor_name) for filepath in filepaths]
+                   for *_, filepaths in jobs]
+        for (entry, class_id, student_section, filepaths), samples in zip(jobs, futures):
+            try:
+                templates = [future.result() for future in samples]
+            except Exception as e:
+                failures.append((entry['id'], f"Could not read samples {', '.join(filepaths)}: {str(e)}"))
+                continue
+            student = {
+                "student_id": entry['id'],
+                "name": entry['name'],
+                "class_id": class_id,
+                "section": student_section,
+                "feature_extractor": extractor_name,
+                "enrollment_date": datetime.datetime.now(),
+                "voice_sample_path": filepaths[0],
+                "voice_sample_paths": filepaths,
+                "updated_at": datetime.datetime.now()
+            }
+            student.update(voiceprint_fields(templates))
+            students.append(student)
+    
+    enrolled = 0
+    if students:
+        try:
+            enrolled = len(db["students"].insert_many(students, ordered=False).inserted_ids)
+        except BulkWriteError as e:
+            enrolled = e.details.get('nInserted', 0)
+            for error in e.details.get('writeErrors', []):
+                failures.append((students[error['index']]['student_id'], error.get('errmsg', "Write failed")))
+    if enrolled:
+        bump_voiceprint_version(db)
+    return enrolled, failures
+
+def batch_attendance(db, recording_path, class_name, section, start_time=None, extractor_name=None,
+                     workers=None):
+    """Mark attendance from a recorded session; returns (student IDs marked, utterances found)"""
+    cls = find_class(db, class_name)
+    if cls is None:
+        raise ValueError(f"Unknown class: {class_name}")
+    if section not in cls['sections']:
+        raise ValueError(f"Unknown section {section} for class {class_name}")
+    
+    # Match only against this section's voiceprints
+    extractor = get_feature_extractor(extractor_name)
+    roster = list(db["students"].find(
+        {"class_id": cls['_id'], "section": section},
+        {"student_id": 1, "name": 1, "voice_features": 1, "voice_templates": 1, "feature_extractor": 1}
+    ))
+    names = {student['student_id']: student['name'] for student in roster}
+    templates = VoiceTemplateCache(db["students"], extractor.name)
+    templates.preload({student['student_id']: student.get('voice_templates') for student in roster})
+    index = VoiceprintIndex()
+    index.build(roster, extractor.name)
+    if not len(index):
+        raise ValueError(f"No {extractor.name} voiceprints enrolled for {class_name} {section}")
+    
+    start_time = start_time or datetime.datetime.fromtimestamp(os.path.getmtime(recording_path))
+    sample_rate = sf.info(recording_path).samplerate
+    segmenter = UtteranceSegmenter(sample_rate)
+    
+    # Stream the recording through the segmenter and extract utterances in parallel
+    futures = []
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        def submit(segments):
+            for start, segment in segments:
+                # The segmenter reports where each utterance began, not how far it has read since
+                offset = start / sample_rate
+                futures.append((offset, executor.submit(extract_segment_features, segment, sample_rate,
+                                                        extractor.name)))
+        
+        for block in sf.blocks(recording_path, blocksize=sample_rate, dtype='float32'):
+            submit(segmenter.feed(block))
+        # An utterance still open when the recording ends
+        submit(segmenter.flush())
+        
+        best = {}
+        for offset, future in futures:
+            student_id, score = match_voiceprint(index, future.result(), extractor.match_threshold, templates)
+            if student_id and (student_id not in best or score > best[student_id][1]):
+                best[student_id] = (offset, score)
+    
+    # One bulk write; students already marked for this session are left untouched
+    write_attendance(db, [
+        attendance_record(student_id, names[student_id], cls['_id'], section,
+                          start_time + datetime.timedelta(seconds=offset), "Present (Recording)")
+        for student_id, (offset, score) in best.items()
+    ])
+    return sorted(best), len(futures)
@@ -0,0 +1,280 @@
+"""Matching benchmark over synthetic speakers and voiceprint populations"""
+import sys
+import json
+import time
+import logging
+import argparse
+import datetime
+import platform
+import tracemalloc
+import numpy as np
+
+from .features import get_feature_extractor
+from .matching import VoiceprintIndex, VOICE_INDEXES, create_voiceprint_index
+
+logger = logging.getLogger(__name__)
+
+# Every voiceprint is extracted from synthetic audio, so 100,000 students take minutes to generate
+DEFAULT_POPULATIONS = [100, 1000, 10000]
+
+def synthetic_speaker(rng):
+    """Random voice: a pitch and three formant resonances"""
+    return {
+        "f0": rng.uniform(85, 255),
+        "formants": np.sort(rng.uniform([300, 900, 2000], [900, 2500, 3500])),
+        "bandwidths": rng.uniform(60, 160, 3)
+    }
+
+def synthetic_utterance(speaker, seconds, sample_rate, rng, noise=0.01):
+    """Formant-shaped harmonic speech with a syllable rhythm and background noise"""
+    n = int(seconds * sample_rate)
+    t = np.arange(n) / sample_rate
+    
+    # A slow pitch contour makes every utterance of a speaker a little different
+    f0 = speaker["f0"] * (1 + 0.05 * np.sin(2 * np.pi * rng.uniform(0.5, 2) * t + rng.uniform(0, 2 * np.pi)))
+    # Harmonics are integer multiples, so wrapping the phase keeps float32 sines exact enough
+    phase = np.mod(2 * np.pi * np.cumsum(f0) / sample_rate, 2 * np.pi).astype(np.float32)
+    harmonics = np.arange(1, int(sample_rate / 2 / (speaker["f0"] * 1.05)))
+    
+    # Harmonic amplitudes follow the speaker's formant envelope; all harmonics in one matrix product
+    freqs = harmonics * speaker["f0"]
+    envelope = np.sum(1.0 / (1.0 + ((freqs[:, None] - speaker["formants"]) / speaker["bandwidths"]) ** 2), axis=1)
+    amplitudes = (envelope / harmonics ** 0.5).astype(np.float32)
+    voiced = amplitudes @ np.sin(np.outer(harmonics.astype(np.float32), phase))
+    
+    # Roughly four syllables per second with short pauses between them
+    syllables = np.clip(np.sin(2 * np.pi * rng.uniform(3, 5) * t + rng.uniform(0, 2 * np.pi)), 0, None)
+    audio = voiced * syllables
+    audio = 0.5 * audio / (np.max(np.abs(audio)) or 1.0)
+    audio += noise * rng.standard_normal(n)
+    return audio.astype(np.float32)
+
+def percentiles(values):
+    """Summary statistics of a list of durations in milliseconds"""
+    values = np.asarray(values) * 1000
+    return {
+        "mean_ms": float(np.mean(values)),
+        "p50_ms": float(np.percentile(values, 50)),
+        "p90_ms": float(np.percentile(values, 90)),
+        "p99_ms": float(np.percentile(values, 99))
+    }
+
+def topk_accuracy(results, expected):
+    """Top-1 and top-5 hit rates of search results against the expected IDs"""
+    top1 = sum(1 for matches, student_id in zip(results, expected) if matches and matches[0][0] == student_id)
+    top5 = sum(1 for matches, student_id in zip(results, expected) if student_id in [m[0] for m in matches[:5]])
+    return {"top1": top1 / len(expected), "top5": top5 / len(expected)}
+
+def score_distribution(scores):
+    """Summary of a set of cosine scores"""
+    return {
+        "p1": float(np.percentile(scores, 1)),
+        "p5": float(np.percentile(scores, 5)),
+        "p50": float(np.percentile(scores, 50)),
+        "p95": float(np.percentile(scores, 95)),
+        "p99": float(np.percentile(scores, 99)),
+        "max": float(np.max(scores))
+    }
+
+def match_scores(index, probes):
+    """Scores of each probe against its own speaker and against every other enrolled speaker"""
+    same = []
+    different = []
+    for probe in probes:
+        scores = index.matrix @ index.normalize(index.to_vector(probe['voice_features']))
+        row = index.positions[probe['student_id']]
+        same.append(scores[row])
+        different.append(np.delete(scores, row))
+    return np.array(same), np.concatenate(different)
+
+def benchmark_extraction(extractor, rng, speakers=20, seconds=3.0, sample_rate=16000, noise_clips=5):
+    """Extraction speed, speaker identification accuracy and score separation on synthetic audio"""
+    voices = [synthetic_speaker(rng) for _ in range(speakers)]
+    timings = []
+    enrolled = []
+    probes = []
+    for number, voice in enumerate(voices):
+        for target in (enrolled, probes):
+            audio = synthetic_utterance(voice, seconds, sample_rate, rng)
+            start = time.perf_counter()
+            features = extractor.extract(audio, sample_rate)
+            timings.append((time.perf_counter() - start) / seconds)
+            target.append({"student_id": f"S{number}", "voice_features": features})
+    
+    index = VoiceprintIndex()
+    index.build(enrolled)
+    results = [index.search(probe['voice_features'], k=5) for probe in probes]
+    
+    # The threshold has to sit between what the right speaker and everyone else (or no one) scores
+    same, different = match_scores(index, probes)
+    noise = [extractor.extract(0.1 * rng.standard_normal(int(seconds * sample_rate)), sample_rate)
+             for _ in range(noise_clips)]
+    noise_scores = np.concatenate([index.matrix @ index.normalize(VoiceprintIndex.to_vector(n)) for n in noise])
+    result = {
+        "extractor": extractor.name,
+        "dimension": int(enrolled[0]['voice_features'].size),
+        "speakers": speakers,
+        "seconds_per_utterance": seconds,
+        "sample_rate": sample_rate,
+        "extraction_per_audio_second": percentiles(timings),
+        "same_speaker_scores": score_distribution(same),
+        "different_speaker_scores": score_distribution(different),
+        "noise_scores": score_distribution(noise_scores),
+        "match_threshold": extractor.match_threshold,
+        "false_accept_rate": float(np.mean(different > extractor.match_threshold)),
+        "false_reject_rate": float(np.mean(same <= extractor.match_threshold))
+    }
+    result.update(topk_accuracy(results, [probe['student_id'] for probe in probes]))
+    return result
+
+def synthetic_population(extractor, size, rng, seconds=1.0, sample_rate=16000):
+    """Synthetic speakers and the voiceprints the extractor produces for one utterance of each"""
+    speakers = []
+    voiceprints = []
+    for row in range(size):
+        speaker = synthetic_speaker(rng)
+        speakers.append(speaker)
+        voiceprints.append(extractor.extract(synthetic_utterance(speaker, seconds, sample_rate, rng), sample_rate))
+        if (row + 1) % 10000 == 0:
+            logger.info(f"Extracted {row + 1} of {size} population voiceprints")
+    return speakers, np.vstack(voiceprints)
+
+def benchmark_population(extractor, speakers, voiceprints, rng, queries=1000, seconds=1.0, sample_rate=16000,
+                         k=5, index_kind="exact"):
+    """Index build time, memory and search latency/accuracy for a population of extracted voiceprints"""
+    size = len(speakers)
+    students = [{"student_id": f"S{row}", "voice_features": voiceprint} for row, voiceprint in enumerate(voiceprints)]
+    
+    tracemalloc.start()
+    start = time.perf_counter()
+    index = create_voiceprint_index(index_kind)
+    index.build(students)
+    build_seconds = time.perf_counter() - start
+    _, build_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del students
+    
+    rows = rng.choice(size, min(queries, size), replace=False)
+    timings = []
+    results = []
+    for row in rows:
+        # Probes are fresh utterances of the enrolled speakers, so accuracy reflects the extractor at this size
+        probe = extractor.extract(synthetic_utterance(speakers[row], seconds, sample_rate, rng), sample_rate)
+        start = time.perf_counter()
+        results.append(index.search(probe, k=k))
+        timings.append(time.perf_counter() - start)
+    
+    result = {
+        "students": size,
+        "index": index_kind,
+        "extractor": extractor.name,
+        "dimension": int(voiceprints.shape[1]),
+        "queries": len(rows),
+        "build_seconds": build_seconds,
+        "index_bytes": int(index.nbytes),
+        "build_peak_bytes": int(build_peak),
+        "search_latency": percentiles(timings)
+    }
+    result.update(topk_accuracy(results, [f"S{row}" for row in rows]))
+    return result
+
+def run_benchmark(populations=None, extractor_name=None, queries=1000, seconds=1.0, seed=0, index_kind="exact"):
+    """Run the extraction and matching benchmarks and return the results as a dict"""
+    rng = np.random.default_rng(seed)
+    extractor = get_feature_extractor(extractor_name)
+    extraction = benchmark_extraction(extractor, rng)
+    logger.info(f"{extractor.name}: {extraction['extraction_per_audio_second']['mean_ms']:.1f} ms per "
+                f"audio second, top-1 {extraction['top1']:.2%}, false accepts {extraction['false_accept_rate']:.2%} "
+                f"and false rejects {extraction['false_reject_rate']:.2%} at {extractor.match_threshold}")
+    
+    # Smaller populations are prefixes of the largest, so its voiceprints are extracted once
+    populations = populations or DEFAULT_POPULATIONS
+    speakers, voiceprints = synthetic_population(extractor, max(populations), rng, seconds)
+    matching = []
+    for size in populations:
+        result = benchmark_population(extractor, speakers[:size], voiceprints[:size], rng, queries, seconds,
+                                      index_kind=index_kind)
+        logger.info(f"{size} students: p50 {result['search_latency']['p50_ms']:.3f} ms, "
+                    f"p99 {result['search_latency']['p99_ms']:.3f} ms, top-1 {result['top1']:.2%}")
+        matching.append(result)
+    
+    return {
+        "created": datetime.datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "machine": platform.platform(),
+        "seed": seed,
+        "seconds_per_utterance": seconds,
+        "index": index_kind,
+        "extraction": extraction,
+        "matching": matching
+    }
+
+def compare_results(baseline, results, tolerance=0.2):
+    """Regressions of results against a baseline run, as human-readable messages"""
+    regressions = []
+    old = baseline['extraction']['extraction_per_audio_second']['mean_ms']
+    new = results['extraction']['extraction_per_audio_second']['mean_ms']
+    if new > old * (1 + tolerance):
+        regressions.append(f"Extraction slowed from {old:.2f} to {new:.2f} ms per audio second")
+    for metric in ("top1", "top5"):
+        if results['extraction'][metric] < baseline['extraction'][metric] - 0.01:
+            regressions.append(f"Speaker {metric} accuracy fell from {baseline['extraction'][metric]:.2%} "
+                               f"to {results['extraction'][metric]:.2%}")
+    for metric in ("false_accept_rate", "false_reject_rate"):
+        if results['extraction'].get(metric, 0) > baseline['extraction'].get(metric, 1) + 0.01:
+            regressions.append(f"Speaker {metric.replace('_', ' ')} rose from {baseline['extraction'][metric]:.2%} "
+                               f"to {results['extraction'][metric]:.2%}")
+    
+    previous = {row['students']: row for row in baseline['matching']}
+    for row in results['matching']:
+        before = previous.get(row['students'])
+        if before is None:
+            continue
+        for metric in ("p50_ms", "p99_ms"):
+            if row['search_latency'][metric] > before['search_latency'][metric] * (1 + tolerance):
+                regressions.append(f"{row['students']} students: {metric} latency rose from "
+                                   f"{before['search_latency'][metric]:.3f} to {row['search_latency'][metric]:.3f}")
+        for metric in ("top1", "top5"):
+            if row[metric] < before[metric] - 0.01:
+                regressions.append(f"{row['students']} students: {metric} accuracy fell from "
+                                   f"{before[metric]:.2%} to {row[metric]:.2%}")
+        if row['index_bytes'] > before['index_bytes'] * (1 + tolerance):
+            regressions.append(f"{row['students']} students: index grew from {before['index_bytes']} "
+                               f"to {row['index_bytes']} bytes")
+    return regressions
+
+def main(argv=None):
+    """Entry point for python -m voice_attendance.benchmark"""
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Benchmark voiceprint extraction and matching")
+    parser.add_argument("--populations", type=int, nargs="+", default=DEFAULT_POPULATIONS,
+                        help="enrolled population sizes to benchmark (default: 100 1000 10000)")
+    parser.add_argument("--extractor", help="feature extractor (default: VOICE_FEATURE_EXTRACTOR or mfcc-v2)")
+    parser.add_argument("--index", choices=sorted(VOICE_INDEXES), default="exact",
+                        help="voiceprint index to benchmark (default: exact)")
+    parser.add_argument("--queries", type=int, default=1000, help="searches timed per population (default: 1000)")
+    parser.add_argument("--seconds", type=float, default=1.0,
+                        help="length of each synthetic utterance behind a population voiceprint (default: 1.0)")
+    parser.add_argument("--seed", type=int, default=0, help="random seed (default: 0)")
+    parser.add_argument("--output", default="benchmark_results.json", help="JSON results file")
+    parser.add_argument("--baseline", help="earlier results file; exit non-zero on regressions")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="allowed relative slowdown against the baseline (default: 0.2)")
+    args = parser.parse_args(argv)
+    
+    results = run_benchmark(args.populations, args.extractor, args.queries, args.seconds, args.seed, args.index)
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    logger.info(f"Benchmark results written to {args.output}")
+    
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare_results(json.load(f), results, args.tolerance)
+        for message in regressions:
+            logger.warning(message)
+        return 1 if regressions else 0
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
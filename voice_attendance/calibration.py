@@ -0,0 +1,56 @@
+"""Per-device microphone calibration cache"""
+import os
+import json
+import logging
+import numpy as np
+
+from .lazy import sd
+
+logger = logging.getLogger(__name__)
+
+class MicrophoneCalibrationCache:
+    """Per-device energy thresholds persisted to a local JSON file"""
+    def __init__(self, path="mic_calibration.json"):
+        self.path = path
+        self.thresholds = {}
+        if os.path.exists(path):
+            try:
+                with open(path) as f:
+                    self.thresholds = json.load(f)
+            except (OSError, ValueError) as e:
+                logger.warning(f"Ignoring unreadable calibration cache {path}: {str(e)}")
+    
+    @staticmethod
+    def device_key():
+        """Identify the default input device"""
+        try:
+            return sd.query_devices(kind='input')['name']
+        except Exception:
+            return "default"
+    
+    def get(self, device):
+        return self.thresholds.get(device)
+    
+    def set(self, device, threshold):
+        self.thresholds[device] = float(threshold)
+    
+    def save(self):
+        try:
+            with open(self.path, "w") as f:
+                json.dump(self.thresholds, f, indent=2)
+        except OSError as e:
+            logger.warning(f"Could not save calibration cache {self.path}: {str(e)}")
+    
+    @staticmethod
+    def adapt(threshold, samples, sample_rate, ratio=1.5, alpha=0.2, frame_ms=30):
+        """Move the threshold towards the noise floor measured in a captured segment"""
+        samples = np.asarray(samples, dtype=np.float32)
+        frame_len = int(sample_rate * frame_ms / 1000)
+        n_frames = len(samples) // frame_len
+        if n_frames < 3:
+            return threshold
+        
+        # The quietest frames of a capture are the pre-speech background
+        frames = samples[:n_frames * frame_len].reshape(n_frames, frame_len)
+        noise_floor = np.percentile(np.sqrt(np.mean(frames ** 2, axis=1)), 10)
+        return (1 - alpha) * threshold + alpha * noise_floor * ratio
@@ -0,0 +1,72 @@
+"""Command line entry point for the headless maintenance commands"""
+import datetime
+import logging
+import argparse
+from dotenv import load_dotenv
+
+from .repository import DATABASE_NAME, get_mongo_client, ensure_indexes, rebuild_daily_summary
+from .batch import bulk_enroll, batch_attendance
+
+logger = logging.getLogger(__name__)
+
+def build_parser():
+    """Argument parser shared by the desktop app and the headless entry point"""
+    parser = argparse.ArgumentParser(description="Voice Attendance System")
+    parser.add_argument("--rebuild-daily-summary", action="store_true",
+                        help="recompute the daily attendance rollup from raw records and exit")
+    parser.add_argument("--bulk-enroll", metavar="ROSTER",
+                        help="enroll every student in a CSV/XLSX roster from WAV samples and exit")
+    parser.add_argument("--wav-dir", default="enrollments",
+                        help="directory of <id>_<name>.wav samples for --bulk-enroll (default: enrollments)")
+    parser.add_argument("--class", dest="class_name",
+                        help="class name for roster rows without a Class column")
+    parser.add_argument("--section", help="section for roster rows without a Section column")
+    parser.add_argument("--workers", type=int, help="feature extraction processes (default: CPU count)")
+    parser.add_argument("--batch-attendance", metavar="RECORDING",
+                        help="mark attendance for --class/--section from a recorded session (WAV/FLAC) and exit")
+    parser.add_argument("--start", help='recording start time "YYYY-MM-DD HH:MM" (default: file modification time)')
+    return parser
+
+def has_command(args):
+    """Whether the parsed arguments request a headless command"""
+    return bool(args.rebuild_daily_summary or args.bulk_enroll or args.batch_attendance)
+
+def run_command_line(args):
+    """Run a headless maintenance command; returns an exit code"""
+    db = get_mongo_client()[DATABASE_NAME]
+    ensure_indexes(db)
+    if args.rebuild_daily_summary:
+        count = rebuild_daily_summary(db)
+        logger.info(f"Rebuilt daily attendance summary: {count} documents")
+    if args.bulk_enroll:
+        enrolled, failures = bulk_enroll(db, args.bulk_enroll, args.wav_dir, args.class_name,
+                                         args.section, workers=args.workers)
+        for student_id, reason in failures:
+            logger.warning(f"Could not enroll {student_id}: {reason}")
+        logger.info(f"Bulk enrollment finished: {enrolled} enrolled, {len(failures)} failed")
+        return 1 if failures else 0
+    if args.batch_attendance:
+        if not args.class_name or not args.section:
+            logger.error("--batch-attendance needs --class and --section")
+            return 2
+        start_time = datetime.datetime.strptime(args.start, "%Y-%m-%d %H:%M") if args.start else None
+        marked, utterances = batch_attendance(db, args.batch_attendance, args.class_name, args.section,
+                                              start_time, workers=args.workers)
+        logger.info(f"Batch attendance finished: {len(marked)} students matched in {utterances} utterances")
+        for student_id in marked:
+            print(student_id)
+    return 0
+
+def main(argv=None):
+    """Entry point for python -m voice_attendance"""
+    load_dotenv()
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if not has_command(args):
+        parser.print_help()
+        return 2
+    return run_command_line(args)
@@ -0,0 +1,160 @@
+"""Voice feature extraction"""
+import os
+import logging
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+class FeatureExtractor:
+    """Interface for turning a recording into a fixed-length voiceprint"""
+    name = "base"
+    match_threshold = 0.7
+    
+    def extract(self, audio_data, sample_rate):
+        """Return a 1-D float32 voiceprint for the given samples"""
+        raise NotImplementedError
+    
+    @staticmethod
+    def to_mono(audio_data):
+        """Convert samples to a mono float32 array, scaling integer PCM to [-1, 1)"""
+        audio = np.asarray(audio_data)
+        if np.issubdtype(audio.dtype, np.integer):
+            audio = audio.astype(np.float32) / float(np.iinfo(audio.dtype).max + 1)
+        else:
+            audio = audio.astype(np.float32, copy=False)
+        if audio.ndim > 1:
+            audio = audio.mean(axis=1)
+        return audio
+
+class StatsFeatureExtractor(FeatureExtractor):
+    """Legacy mean/std/length features, kept for comparison only"""
+    name = "stats"
+    match_threshold = 0.7
+    
+    def extract(self, audio_data, sample_rate):
+        audio = self.to_mono(audio_data)
+        return np.array([np.mean(audio), np.std(audio), len(audio)], dtype=np.float32)
+
+class MFCCFeatureExtractor(FeatureExtractor):
+    """NumPy-only MFCC mean + covariance speaker embedding (uncentred; superseded by mfcc-v2)"""
+    name = "mfcc-v1"
+    match_threshold = 0.8
+    
+    def __init__(self, n_mfcc=19, n_mels=40, frame_ms=25, hop_ms=10, fmin=20.0, fmax=8000.0):
+        self.n_mfcc = n_mfcc
+        self.n_mels = n_mels
+        self.frame_ms = frame_ms
+        self.hop_ms = hop_ms
+        self.fmin = fmin
+        self.fmax = fmax
+        self._filterbanks = {}
+        self._triu = np.triu_indices(n_mfcc)
+        self._dct = self._dct_matrix(n_mels, n_mfcc)
+    
+    @property
+    def dimension(self):
+        return self.n_mfcc + len(self._triu[0])
+    
+    @staticmethod
+    def _dct_matrix(n_mels, n_mfcc):
+        """Orthonormal DCT-II basis, skipping the energy coefficient c0"""
+        n = np.arange(n_mels)
+        k = np.arange(1, n_mfcc + 1)[:, None]
+        return (np.cos(np.pi * k * (2 * n + 1) / (2 * n_mels)) * np.sqrt(2.0 / n_mels)).astype(np.float32)
+    
+    def _filterbank(self, sample_rate, n_fft):
+        """Triangular mel filterbank, cached per sample rate"""
+        key = (sample_rate, n_fft)
+        if key not in self._filterbanks:
+            fmax = min(self.fmax, sample_rate / 2)
+            mel_min, mel_max = [2595.0 * np.log10(1.0 + f / 700.0) for f in (self.fmin, fmax)]
+            hz_points = 700.0 * (10 ** (np.linspace(mel_min, mel_max, self.n_mels + 2) / 2595.0) - 1.0)
+            bins = np.fft.rfftfreq(n_fft, 1.0 / sample_rate)
+            
+            lower, center, upper = hz_points[:-2, None], hz_points[1:-1, None], hz_points[2:, None]
+            rising = (bins - lower) / (center - lower)
+            falling = (upper - bins) / (upper - center)
+            self._filterbanks[key] = np.maximum(0, np.minimum(rising, falling)).astype(np.float32)
+        return self._filterbanks[key]
+    
+    def mfcc(self, audio_data, sample_rate):
+        """Compute an (n_frames, n_mfcc) MFCC matrix over vectorized frames"""
+        audio = self.to_mono(audio_data)
+        frame_len = int(sample_rate * self.frame_ms / 1000)
+        hop = int(sample_rate * self.hop_ms / 1000)
+        n_fft = 1 << (frame_len - 1).bit_length()
+        
+        # Pre-emphasis, then pad so even very short clips yield one frame
+        audio = np.append(audio[:1], audio[1:] - 0.97 * audio[:-1])
+        if len(audio) < frame_len:
+            audio = np.pad(audio, (0, frame_len - len(audio)))
+        
+        frames = np.lib.stride_tricks.sliding_window_view(audio, frame_len)[::hop]
+        frames = frames * np.hamming(frame_len).astype(np.float32)
+        power = np.abs(np.fft.rfft(frames, n_fft)) ** 2 / n_fft
+        
+        # Drop near-silent frames so pauses do not dilute the voiceprint
+        energy = power.sum(axis=1)
+        voiced = energy > energy.max() * 1e-3
+        if voiced.sum() >= 2:
+            power = power[voiced]
+        
+        log_mel = np.log(power @ self._filterbank(sample_rate, n_fft).T + 1e-10)
+        return log_mel @ self._dct.T
+    
+    def extract(self, audio_data, sample_rate):
+        coeffs = self.mfcc(audio_data, sample_rate)
+        mean = coeffs.mean(axis=0)
+        if len(coeffs) > 1:
+            cov = np.cov(coeffs, rowvar=False)[self._triu]
+        else:
+            cov = np.zeros(len(self._triu[0]))
+        # Signed square root brings covariance terms back to the scale of the mean
+        cov = np.sign(cov) * np.sqrt(np.abs(cov))
+        return np.concatenate([mean, cov]).astype(np.float32)
+
+class NormalizedMFCCFeatureExtractor(MFCCFeatureExtractor):
+    """MFCC correlation embedding: per-utterance mean/variance normalisation, then the whitened covariance"""
+    name = "mfcc-v2"
+    # Set from the benchmark's score distributions (synthetic speakers, 1-3 s probes): at 0.85 about
+    # 0.3% of different-speaker pairs are accepted and 0.2% of same-speaker probes rejected, and
+    # background noise scores below 0.4
+    match_threshold = 0.85
+    
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        # The diagonal of a correlation matrix is always 1, so only the upper triangle carries information
+        self._triu = np.triu_indices(self.n_mfcc, 1)
+    
+    @property
+    def dimension(self):
+        return len(self._triu[0])
+    
+    def extract(self, audio_data, sample_rate):
+        coeffs = self.mfcc(audio_data, sample_rate)
+        if len(coeffs) < 2:
+            return np.zeros(self.dimension, dtype=np.float32)
+        # The cepstral mean and scale are shared by every voice (and channel), so they are normalised away;
+        # what is left is how the coefficients move together, which centres different speakers near zero
+        coeffs = (coeffs - coeffs.mean(axis=0)) / (coeffs.std(axis=0) + 1e-6)
+        corr = coeffs.T @ coeffs / len(coeffs)
+        return corr[self._triu].astype(np.float32)
+
+def audio_data_to_samples(audio):
+    """Decode speech_recognition AudioData into (int16 samples, sample_rate) without touching disk"""
+    raw = audio.get_raw_data() if audio.sample_width == 2 else audio.get_raw_data(convert_width=2)
+    # frombuffer is a zero-copy view over the captured frames
+    return np.frombuffer(raw, dtype="<i2"), audio.sample_rate
+
+FEATURE_EXTRACTORS = {
+    StatsFeatureExtractor.name: StatsFeatureExtractor,
+    MFCCFeatureExtractor.name: MFCCFeatureExtractor,
+    NormalizedMFCCFeatureExtractor.name: NormalizedMFCCFeatureExtractor,
+}
+
+def get_feature_extractor(name=None):
+    """Create the feature extractor configured by VOICE_FEATURE_EXTRACTOR"""
+    name = name or os.getenv("VOICE_FEATURE_EXTRACTOR", NormalizedMFCCFeatureExtractor.name)
+    if name not in FEATURE_EXTRACTORS:
+        raise ValueError(f"Unknown feature extractor: {name}")
+    return FEATURE_EXTRACTORS[name]()
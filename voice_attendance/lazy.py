@@ -0,0 +1,25 @@
+"""Lazy imports for heavy optional dependencies"""
+import time
+import importlib
+import logging
+
+logger = logging.getLogger(__name__)
+
+class LazyModule:
+    """Module proxy that imports the real module on first attribute access"""
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+    
+    def __getattr__(self, attr):
+        if self._module is None:
+            start = time.perf_counter()
+            self._module = importlib.import_module(self._name)
+            logger.info(f"Loaded {self._name} in {(time.perf_counter() - start) * 1000:.0f} ms")
+        return getattr(self._module, attr)
+
+# Heavy dependencies load only when the feature that needs them is first used
+sr = LazyModule("speech_recognition")
+sf = LazyModule("soundfile")
+sd = LazyModule("sounddevice")
+openpyxl = LazyModule("openpyxl")
@@ -0,0 +1,445 @@
+"""Voiceprint matching and utterance segmentation"""
+import os
+import time
+import logging
+import numpy as np
+
+from .features import FeatureExtractor, StatsFeatureExtractor
+
+logger = logging.getLogger(__name__)
+
+def match_voiceprint(index, features, threshold, templates=None, candidates=5):
+    """Best (student_id, score) in the index, or (None, 0) when below the threshold"""
+    if templates is None:
+        # Score against all candidate samples in a single pass
+        matches = index.search(features, k=1)
+    else:
+        # Centroids shortlist the candidates, their per-sample templates decide between them
+        matches = rescore_with_templates(index.search(features, k=candidates), features, templates)
+    best_match, best_score = matches[0] if matches else (None, -1)
+    
+    logger.info(f"Best voice match: {best_match} with score: {best_score}")
+    
+    # Return match if score is above the extractor's threshold
+    return (best_match, best_score) if best_score > threshold else (None, 0)
+
+def rescore_with_templates(matches, features, templates):
+    """Re-rank (student_id, centroid score) matches by each student's best per-sample template score"""
+    if not matches:
+        return matches
+    query = VoiceprintIndex.normalize(VoiceprintIndex.to_vector(features))
+    found = templates([student_id for student_id, _ in matches])
+    rescored = []
+    for student_id, score in matches:
+        samples = found.get(student_id)
+        if samples is not None and len(samples) and samples.shape[1] == query.size:
+            score = max(score, float(np.max(samples @ query)))
+        rescored.append((student_id, score))
+    rescored.sort(key=lambda match: -match[1])
+    return rescored
+
+def voiceprint_centroid(templates):
+    """Mean of the L2-normalised per-sample voiceprints, used for the first matching pass"""
+    vectors = VoiceprintIndex.normalize(np.vstack([VoiceprintIndex.to_vector(template) for template in templates]))
+    return VoiceprintIndex.normalize(vectors.mean(axis=0))
+
+class VoiceprintIndex:
+    """Contiguous matrix of L2-normalised voiceprints for vectorized matching"""
+    def __init__(self):
+        self.matrix = np.empty((0, 0), dtype=np.float32)
+        self.ids = np.empty(0, dtype=object)
+        self.positions = {}
+    
+    def __len__(self):
+        return len(self.ids)
+    
+    @property
+    def nbytes(self):
+        """Memory held by the voiceprint matrix and ID array"""
+        return self.matrix.nbytes + self.ids.nbytes
+    
+    @staticmethod
+    def to_vector(features):
+        """Convert stored voice features into a flat float32 vector"""
+        if isinstance(features, dict):
+            features = [features['mean'], features['std'], features['length']]
+        return np.asarray(features, dtype=np.float32).ravel()
+    
+    @staticmethod
+    def normalize(vectors):
+        """L2-normalise vectors along the last axis, leaving zero vectors untouched"""
+        norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return vectors / norms
+    
+    def build(self, students, extractor_name=None):
+        """Rebuild the index from a list of student documents"""
+        vectors = []
+        ids = []
+        for student in students:
+            if 'voice_features' not in student:
+                continue
+            if extractor_name and student.get('feature_extractor', StatsFeatureExtractor.name) != extractor_name:
+                continue
+            vector = self.to_vector(student['voice_features'])
+            if vectors and vector.shape != vectors[0].shape:
+                logger.warning(f"Skipping voiceprint for {student['student_id']}: dimension {vector.size} "
+                               f"does not match index dimension {vectors[0].size}")
+                continue
+            vectors.append(vector)
+            ids.append(student['student_id'])
+        
+        if vectors:
+            self.matrix = np.ascontiguousarray(self.normalize(np.vstack(vectors)), dtype=np.float32)
+        else:
+            self.matrix = np.empty((0, 0), dtype=np.float32)
+        self.ids = np.array(ids, dtype=object)
+        self.positions = {student_id: row for row, student_id in enumerate(ids)}
+        logger.info(f"Voiceprint index built with {len(ids)} entries")
+    
+    def attach(self, matrix, ids):
+        """Use an already normalised matrix, such as a memory-mapped store, without copying it"""
+        self.matrix = matrix
+        self.ids = np.array(ids, dtype=object)
+        self.positions = {student_id: row for row, student_id in enumerate(self.ids)}
+    
+    def add(self, student_id, features):
+        """Insert or replace a single voiceprint without rebuilding the index"""
+        self.add_many([(student_id, features)])
+    
+    def add_many(self, entries):
+        """Insert or replace (student_id, features) pairs, copying the matrix at most once"""
+        vectors = {}
+        for student_id, features in entries:
+            vectors[student_id] = self.normalize(self.to_vector(features)).astype(np.float32)
+        if not vectors:
+            return
+        
+        # Validate everything before touching the index
+        dimension = self.matrix.shape[1] if len(self.ids) else next(iter(vectors.values())).size
+        for vector in vectors.values():
+            if vector.size != dimension:
+                raise ValueError(f"Voiceprint dimension {vector.size} does not match index dimension {dimension}")
+        
+        new_ids = [student_id for student_id in vectors if student_id not in self.positions]
+        replaced = [student_id for student_id in vectors if student_id in self.positions]
+        if replaced:
+            if not self.matrix.flags.writeable:
+                # Memory-mapped stores are read-only, so patch a private copy
+                self.matrix = np.array(self.matrix)
+            for student_id in replaced:
+                self.matrix[self.positions[student_id]] = vectors[student_id]
+        
+        if new_ids:
+            self.matrix = np.ascontiguousarray(np.vstack(
+                [self.matrix.reshape(-1, dimension)] + [vectors[student_id] for student_id in new_ids]))
+            start = len(self.ids)
+            self.ids = np.append(self.ids, np.array(new_ids, dtype=object))
+            for row, student_id in enumerate(new_ids, start):
+                self.positions[student_id] = row
+    
+    def remove(self, student_id):
+        """Drop a voiceprint by moving the last row into its place; False if it was not indexed"""
+        row = self.positions.pop(student_id, None)
+        if row is None:
+            return False
+        
+        last = len(self.ids) - 1
+        if row != last:
+            if not self.matrix.flags.writeable:
+                self.matrix = np.array(self.matrix)
+            self.matrix[row] = self.matrix[last]
+            self.ids[row] = self.ids[last]
+            self.positions[self.ids[row]] = row
+        self.matrix = self.matrix[:last]
+        self.ids = self.ids[:last]
+        return True
+    
+    def holds(self, student_id, features):
+        """Whether the index already has this voiceprint for the student"""
+        row = self.positions.get(student_id)
+        if row is None:
+            return False
+        vector = self.normalize(self.to_vector(features))
+        return vector.size == self.matrix.shape[1] and np.allclose(self.matrix[row], vector, atol=1e-6)
+    
+    def subset(self, student_ids):
+        """Return a new index restricted to the given students"""
+        rows = [self.positions[sid] for sid in student_ids if sid in self.positions]
+        index = VoiceprintIndex()
+        if rows:
+            index.matrix = np.ascontiguousarray(self.matrix[rows])
+            index.ids = self.ids[rows]
+            index.positions = {student_id: row for row, student_id in enumerate(index.ids)}
+        return index
+    
+    def search(self, features, k=1):
+        """Return the top-k (student_id, score) pairs by cosine similarity"""
+        if not len(self.ids):
+            return []
+        
+        query = self.normalize(self.to_vector(features))
+        if query.size != self.matrix.shape[1]:
+            raise ValueError(f"Query dimension {query.size} does not match index dimension {self.matrix.shape[1]}")
+        
+        # One matrix-vector product scores every enrolled voiceprint
+        scores = self.matrix @ query
+        return [(self.ids[i], float(scores[i])) for i in self.top_k(scores, k)]
+    
+    @staticmethod
+    def top_k(scores, k):
+        """Positions of the k highest scores, best first"""
+        k = min(k, len(scores))
+        if k == 1:
+            return np.array([np.argmax(scores)])
+        top = np.argpartition(-scores, k - 1)[:k]
+        return top[np.argsort(-scores[top])]
+
+class IVFVoiceprintIndex(VoiceprintIndex):
+    """Inverted-file index: voiceprints partitioned by spherical k-means, searching only the nearest partitions"""
+    def __init__(self, nprobe=8, min_train_size=2000, iterations=10, seed=0):
+        super().__init__()
+        self.nprobe = nprobe
+        self.min_train_size = min_train_size
+        self.iterations = iterations
+        self.seed = seed
+        self.centroids = np.empty((0, 0), dtype=np.float32)
+        self.assignments = np.empty(0, dtype=np.int32)
+        self.lists = []
+        self.trained_size = 0
+        self.extractor_name = None
+    
+    @property
+    def nbytes(self):
+        return super().nbytes + self.centroids.nbytes + self.assignments.nbytes
+    
+    def build(self, students, extractor_name=None):
+        super().build(students, extractor_name)
+        self.extractor_name = extractor_name
+        self.train()
+    
+    def train(self):
+        """Cluster the current voiceprints and assign every row to its nearest centroid"""
+        count = len(self.ids)
+        if count < self.min_train_size:
+            # Small rosters are searched exactly
+            self.centroids = np.empty((0, 0), dtype=np.float32)
+            self.assignments = np.empty(0, dtype=np.int32)
+            self.lists = []
+            self.trained_size = 0
+            return
+        
+        start = time.perf_counter()
+        nlist = int(np.sqrt(count))
+        rng = np.random.default_rng(self.seed)
+        sample = self.matrix[np.sort(rng.choice(count, min(count, nlist * 64), replace=False))]
+        centroids = sample[rng.choice(len(sample), nlist, replace=False)]
+        for _ in range(self.iterations):
+            labels = np.argmax(sample @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, labels, sample)
+            # Empty partitions restart from a random voiceprint
+            empty = np.flatnonzero(np.bincount(labels, minlength=nlist) == 0)
+            sums[empty] = sample[rng.choice(len(sample), len(empty))]
+            centroids = self.normalize(sums)
+        
+        self.centroids = np.ascontiguousarray(centroids, dtype=np.float32)
+        self.assignments = self.assign(self.matrix)
+        self.lists = self.partition(self.assignments, nlist)
+        self.trained_size = count
+        logger.info(f"Voiceprint index clustered into {nlist} partitions in {time.perf_counter() - start:.2f} s")
+    
+    def assign(self, vectors, chunk=8192):
+        """Nearest centroid for each vector"""
+        return np.concatenate([
+            np.argmax(vectors[i:i + chunk] @ self.centroids.T, axis=1) for i in range(0, len(vectors), chunk)
+        ]).astype(np.int32)
+    
+    @staticmethod
+    def partition(assignments, nlist):
+        """Row numbers belonging to each partition"""
+        order = np.argsort(assignments, kind="stable")
+        bounds = np.searchsorted(assignments[order], np.arange(nlist + 1))
+        return [order[bounds[i]:bounds[i + 1]] for i in range(nlist)]
+    
+    def add_many(self, entries):
+        entries = list(entries)
+        count = len(self.ids)
+        super().add_many(entries)
+        if not self.trained_size:
+            if len(self.ids) >= self.min_train_size:
+                self.train()
+            return
+        
+        # Place new and changed voiceprints in their nearest partitions
+        rows = np.array(sorted({self.positions[student_id] for student_id, _ in entries}), dtype=np.int64)
+        if not len(rows):
+            return
+        self.assignments = np.concatenate([self.assignments, np.zeros(len(self.ids) - count, dtype=np.int32)])
+        for row, cluster in zip(rows, self.assign(self.matrix[rows])):
+            if row < count:
+                old = self.assignments[row]
+                if old == cluster:
+                    continue
+                self.lists[old] = self.lists[old][self.lists[old] != row]
+            self.assignments[row] = cluster
+            self.lists[cluster] = np.append(self.lists[cluster], row)
+        
+        # Partitions drift as the roster grows, so recluster once it has doubled
+        if len(self.ids) >= 2 * self.trained_size:
+            self.train()
+    
+    def remove(self, student_id):
+        row = self.positions.get(student_id)
+        if row is None or not self.trained_size:
+            return super().remove(student_id)
+        
+        # Mirror the base class: the last row moves into the freed slot
+        last = len(self.ids) - 1
+        cluster = self.assignments[row]
+        self.lists[cluster] = self.lists[cluster][self.lists[cluster] != row]
+        if row != last:
+            moved = self.assignments[last]
+            self.lists[moved] = np.where(self.lists[moved] == last, row, self.lists[moved])
+            self.assignments[row] = moved
+        self.assignments = self.assignments[:last]
+        return super().remove(student_id)
+    
+    def search(self, features, k=1):
+        if not self.trained_size:
+            return super().search(features, k)
+        
+        query = self.normalize(self.to_vector(features))
+        if query.size != self.matrix.shape[1]:
+            raise ValueError(f"Query dimension {query.size} does not match index dimension {self.matrix.shape[1]}")
+        
+        # Score only the voiceprints in the partitions closest to the query
+        nprobe = min(self.nprobe, len(self.lists))
+        closest = np.argpartition(-(self.centroids @ query), nprobe - 1)[:nprobe]
+        rows = np.concatenate([self.lists[cluster] for cluster in closest])
+        if not len(rows):
+            return []
+        scores = self.matrix[rows] @ query
+        return [(self.ids[rows[i]], float(scores[i])) for i in self.top_k(scores, k)]
+    
+    def save_partitions(self, path, version):
+        """Write the clustering for a given voiceprint store version; the matrix itself lives in the store"""
+        with open(path + ".tmp", "wb") as f:
+            np.savez(
+                f,
+                centroids=self.centroids,
+                assignments=self.assignments,
+                trained_size=np.int64(self.trained_size),
+                version=np.int64(version)
+            )
+        os.replace(path + ".tmp", path)
+    
+    def load_partitions(self, path, version):
+        """Restore the clustering saved for this store version; False when it must be retrained"""
+        try:
+            with np.load(path, allow_pickle=False) as data:
+                if int(data['version']) != version or len(data['assignments']) != len(self.ids):
+                    return False
+                self.centroids = np.ascontiguousarray(data['centroids'])
+                self.assignments = data['assignments']
+                self.trained_size = int(data['trained_size'])
+        except (OSError, ValueError, KeyError) as e:
+            logger.info(f"No usable voiceprint partitions at {path}: {str(e)}")
+            return False
+        self.lists = self.partition(self.assignments, len(self.centroids)) if self.trained_size else []
+        return True
+
+VOICE_INDEXES = {
+    "exact": VoiceprintIndex,
+    "ivf": IVFVoiceprintIndex
+}
+
+def create_voiceprint_index(kind=None):
+    """Empty index of the kind configured by VOICE_INDEX (defaults to exact search)"""
+    kind = kind or os.getenv("VOICE_INDEX", "exact")
+    if kind not in VOICE_INDEXES:
+        raise ValueError(f"Unknown voiceprint index: {kind}")
+    if kind == "ivf":
+        return IVFVoiceprintIndex(nprobe=int(os.getenv("VOICE_INDEX_NPROBE", "8")))
+    return VOICE_INDEXES[kind]()
+
+class UtteranceSegmenter:
+    """Energy-based voice activity segmenter over a fixed-size ring buffer"""
+    def __init__(self, sample_rate, frame_ms=30, threshold_ratio=3.0, min_rms=0.005,
+                 min_speech_ms=250, hangover_ms=500, preroll_ms=200, max_utterance_s=8):
+        self.sample_rate = sample_rate
+        self.frame_len = int(sample_rate * frame_ms / 1000)
+        self.threshold_ratio = threshold_ratio
+        self.min_rms = min_rms
+        self.min_speech_frames = max(1, min_speech_ms // frame_ms)
+        self.hangover_frames = max(1, hangover_ms // frame_ms)
+        self.preroll = int(sample_rate * preroll_ms / 1000)
+        self.max_utterance = int(sample_rate * max_utterance_s)
+        
+        # Large enough for the longest utterance plus its pre-roll
+        self.ring = np.zeros(self.max_utterance + self.preroll + self.frame_len, dtype=np.float32)
+        self.total = 0
+        self.pending = np.empty(0, dtype=np.float32)
+        self.noise_floor = None
+        self.start = None
+        self.speech_frames = 0
+        self.silent_frames = 0
+    
+    def _write(self, frame):
+        """Append a frame to the ring buffer, wrapping around at the end"""
+        pos = self.total % len(self.ring)
+        first = min(len(frame), len(self.ring) - pos)
+        self.ring[pos:pos + first] = frame[:first]
+        self.ring[:len(frame) - first] = frame[first:]
+        self.total += len(frame)
+    
+    def _read(self, start, end):
+        """Copy absolute sample positions [start, end) out of the ring buffer"""
+        return self.ring[np.arange(start, end) % len(self.ring)]
+    
+    def feed(self, block):
+        """Consume a block of samples and return any completed utterances as (start sample, samples) pairs"""
+        samples = np.concatenate([self.pending, FeatureExtractor.to_mono(block)])
+        n_frames = len(samples) // self.frame_len
+        frames = samples[:n_frames * self.frame_len].reshape(n_frames, self.frame_len)
+        self.pending = samples[n_frames * self.frame_len:]
+        levels = np.sqrt(np.mean(frames ** 2, axis=1))
+        
+        segments = []
+        for frame, level in zip(frames, levels):
+            self._write(frame)
+            if self.noise_floor is None:
+                self.noise_floor = level
+            voiced = level > max(self.noise_floor * self.threshold_ratio, self.min_rms)
+            
+            if self.start is None:
+                if voiced:
+                    self.start = max(self.total - len(frame) - self.preroll, 0)
+                    self.speech_frames = 1
+                    self.silent_frames = 0
+                else:
+                    # Track the background level while nobody is speaking
+                    self.noise_floor = 0.95 * self.noise_floor + 0.05 * level
+                continue
+            
+            if voiced:
+                self.speech_frames += 1
+                self.silent_frames = 0
+            else:
+                self.silent_frames += 1
+            
+            if self.silent_frames >= self.hangover_frames or self.total - self.start >= self.max_utterance:
+                if self.speech_frames >= self.min_speech_frames:
+                    segments.append((self.start, self._read(self.start, self.total)))
+                self.start = None
+        return segments
+    
+    def flush(self):
+        """Return the utterance still open at the end of the stream, if it has enough speech, like feed"""
+        segments = []
+        if self.start is not None and self.speech_frames >= self.min_speech_frames:
+            segments.append((self.start, self._read(self.start, self.total)))
+        self.start = None
+        self.speech_frames = 0
+        self.silent_frames = 0
+        return segments
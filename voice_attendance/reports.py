@@ -0,0 +1,195 @@
+"""Attendance report queries, aggregations and file export"""
+import csv
+import datetime
+import logging
+
+from .lazy import openpyxl
+
+logger = logging.getLogger(__name__)
+
+def attendance_query(class_id=None, section=None, start=None, end=None):
+    """Attendance filter for an optional class, section and inclusive date range"""
+    query = {}
+    if class_id:
+        query["class_id"] = class_id
+    if section:
+        query["section"] = section
+    if start or end:
+        query["date"] = {}
+        if start:
+            query["date"]["$gte"] = start
+        if end:
+            query["date"]["$lt"] = end + datetime.timedelta(days=1)
+    return query
+
+def attendance_cursor(collection, query, projection, sort, skip=0, batch_size=1000):
+    """Sorted cursor over matching attendance records, skipping rows already read"""
+    return collection.find(query, projection).sort(sort).skip(skip).batch_size(batch_size)
+
+def export_attendance(collection, query, sort, projection, headers, row_fn, filepath, progress_fn=None):
+    """Stream matching attendance records into a file; progress_fn gets (written, total)"""
+    total = collection.count_documents(query)
+    rows = (row_fn(record) for record in attendance_cursor(collection, query, projection, sort))
+    return write_rows(filepath, headers, rows, progress_fn and (lambda count: progress_fn(count, total)))
+
+def day_projection(fields):
+    """$project stage keeping the given fields plus the record's calendar day"""
+    stage = {field: 1 for field in fields}
+    stage["day"] = {"$dateToString": {"format": "%Y-%m-%d", "date": "$date"}}
+    return {"$project": stage}
+
+def attendance_summary(collection, query):
+    """Per-student attended and total session counts, computed by MongoDB"""
+    pipeline = [
+        {"$match": query},
+        day_projection(["class_id", "section", "student_id", "name"]),
+        # Days each student attended
+        {"$group": {
+            "_id": {"class_id": "$class_id", "section": "$section", "student_id": "$student_id"},
+            "name": {"$first": "$name"},
+            "days": {"$addToSet": "$day"}
+        }},
+        # Sessions held per section are the union of all its students' days
+        {"$group": {
+            "_id": {"class_id": "$_id.class_id", "section": "$_id.section"},
+            "students": {"$push": {
+                "student_id": "$_id.student_id",
+                "name": "$name",
+                "attended": {"$size": "$days"}
+            }},
+            "day_sets": {"$push": "$days"}
+        }},
+        {"$project": {
+            "students": 1,
+            "sessions": {"$size": {"$reduce": {
+                "input": "$day_sets",
+                "initialValue": [],
+                "in": {"$setUnion": ["$$value", "$$this"]}
+            }}}
+        }},
+        {"$unwind": "$students"},
+        {"$project": {
+            "_id": 0,
+            "class_id": "$_id.class_id",
+            "section": "$_id.section",
+            "student_id": "$students.student_id",
+            "name": "$students.name",
+            "attended": "$students.attended",
+            "sessions": 1
+        }},
+        {"$sort": {"class_id": 1, "section": 1, "student_id": 1}}
+    ]
+    return list(collection.aggregate(pipeline, allowDiskUse=True))
+
+def presence_matrix(collection, query):
+    """Sorted session days and, per student, the days they were present"""
+    pipeline = [
+        {"$match": query},
+        day_projection(["class_id", "section", "student_id", "name"]),
+        {"$group": {
+            "_id": {"class_id": "$class_id", "section": "$section", "student_id": "$student_id"},
+            "name": {"$first": "$name"},
+            "days": {"$addToSet": "$day"}
+        }},
+        {"$project": {
+            "_id": 0,
+            "class_id": "$_id.class_id",
+            "section": "$_id.section",
+            "student_id": "$_id.student_id",
+            "name": 1,
+            "days": 1
+        }},
+        {"$sort": {"class_id": 1, "section": 1, "student_id": 1}}
+    ]
+    students = list(collection.aggregate(pipeline, allowDiskUse=True))
+    days = sorted(set().union(*(student['days'] for student in students)))
+    return days, students
+
+def write_rows(filepath, headers, rows, progress_fn=None, progress_every=1000):
+    """Stream rows into a CSV file or a write-only XLSX workbook with constant memory"""
+    count = 0
+    if filepath.lower().endswith(".csv"):
+        with open(filepath, "w", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            writer.writerow(headers)
+            for row in rows:
+                writer.writerow(row)
+                count += 1
+                if progress_fn and count % progress_every == 0:
+                    progress_fn(count)
+    else:
+        workbook = openpyxl.Workbook(write_only=True)
+        sheet = workbook.create_sheet("Attendance")
+        sheet.append(headers)
+        for row in rows:
+            sheet.append(row)
+            count += 1
+            if progress_fn and count % progress_every == 0:
+                progress_fn(count)
+        workbook.save(filepath)
+    
+    if progress_fn:
+        progress_fn(count)
+    return count
+
+def filter_roster(students, query):
+    """Enrolled students matching the class/section part of a report query"""
+    return [
+        student for student in students
+        if all(student.get(field) == query[field] for field in ("class_id", "section") if field in query)
+    ]
+
+def daily_totals_rows(summary_col, query, class_name_fn):
+    """Headers and rows of present counts per section per day, read from the daily rollup"""
+    # Read from the pre-aggregated rollup: one small document per section per day
+    days = summary_col.find(query, {"_id": 0, "class_id": 1, "section": 1, "date": 1, "present_count": 1})
+    headers = ["Date", "Class", "Section", "Present"]
+    rows = [
+        [day['date'].strftime("%Y-%m-%d"), class_name_fn(day['class_id']), day['section'], day['present_count']]
+        for day in days.sort("date", 1)
+    ]
+    return headers, rows
+
+def student_summary_rows(collection, query, roster, class_name_fn):
+    """Headers and rows of attended/total sessions per student, including students never present"""
+    summary = attendance_summary(collection, query)
+    sessions = {(row['class_id'], row['section']): row['sessions'] for row in summary}
+    seen = {(row['class_id'], row['section'], row['student_id']) for row in summary}
+    for student in roster:
+        key = (student['class_id'], student['section'], student['student_id'])
+        if key not in seen:
+            summary.append({
+                "class_id": student['class_id'],
+                "section": student['section'],
+                "student_id": student['student_id'],
+                "name": student['name'],
+                "attended": 0,
+                "sessions": sessions.get(key[:2], 0)
+            })
+    
+    headers = ["Class", "Section", "Student ID", "Name", "Attended", "Sessions", "Attendance %"]
+    rows = [
+        [class_name_fn(row['class_id']), row['section'], row['student_id'], row['name'],
+         row['attended'], row['sessions'],
+         round(100.0 * row['attended'] / row['sessions'], 1) if row['sessions'] else 0.0]
+        for row in summary
+    ]
+    rows.sort(key=lambda row: (row[0], row[1], row[2]))
+    return headers, rows
+
+def presence_matrix_rows(collection, query, roster, class_name_fn):
+    """Headers and rows of a student x day presence grid, including students never present"""
+    days, students = presence_matrix(collection, query)
+    seen = {(row['class_id'], row['section'], row['student_id']) for row in students}
+    for student in roster:
+        if (student['class_id'], student['section'], student['student_id']) not in seen:
+            students.append(dict(student, days=[]))
+    
+    headers = ["Class", "Section", "Student ID", "Name"] + days + ["Total"]
+    rows = []
+    for row in students:
+        present = set(row['days'])
+        rows.append([class_name_fn(row['class_id']), row['section'], row['student_id'], row['name']]
+                    + ["P" if day in present else "" for day in days] + [len(present)])
+    rows.sort(key=lambda row: (row[0], row[1], row[2]))
+    return headers, rows
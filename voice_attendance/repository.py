@@ -0,0 +1,292 @@
+"""MongoDB access: pooled client, indexes, student/class/attendance records and the daily attendance rollup"""
+import os
+import datetime
+import logging
+import threading
+from pymongo import MongoClient, ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError, PyMongoError
+
+from .lazy import sf
+from .features import StatsFeatureExtractor
+from .matching import VoiceprintIndex, voiceprint_centroid
+
+logger = logging.getLogger(__name__)
+
+DATABASE_NAME = "voice_attendance_system"
+
+_mongo_client = None
+_mongo_lock = threading.Lock()
+_indexes_ensured = False
+
+# Student fields needed for lists and lookups; voiceprints are read through the voiceprint store
+STUDENT_FIELDS = {"student_id": 1, "name": 1, "class_id": 1, "section": 1, "enrollment_date": 1,
+                  "feature_extractor": 1, "voice_sample_path": 1, "voice_sample_paths": 1, "updated_at": 1}
+
+def get_mongo_client():
+    """Return the process-wide pooled MongoClient, creating it on first use"""
+    global _mongo_client
+    with _mongo_lock:
+        if _mongo_client is None:
+            mongodb_uri = os.getenv("MONGO_URI", "mongodb://localhost:27017/")
+            logger.info(f"Connecting to MongoDB at: {mongodb_uri}")
+            _mongo_client = MongoClient(
+                mongodb_uri,
+                serverSelectionTimeoutMS=5000,
+                maxPoolSize=int(os.getenv("MONGO_MAX_POOL_SIZE", "20"))
+            )
+        return _mongo_client
+
+def ensure_indexes(db):
+    """Create the collection indexes once per process"""
+    global _indexes_ensured
+    with _mongo_lock:
+        if _indexes_ensured:
+            return
+        db["students"].create_index("student_id", unique=True)
+        db["students"].create_index([("class_id", 1), ("section", 1)])
+        db["students"].create_index("updated_at")
+        db["attendance"].create_index([("student_id", 1), ("date", 1)], unique=True)
+        db["attendance"].create_index([("class_id", 1), ("section", 1), ("date", -1)])
+        # One record per student per class session; older records without a session_date are exempt
+        db["attendance"].create_index(
+            [("student_id", 1), ("class_id", 1), ("section", 1), ("session_date", 1)],
+            unique=True,
+            partialFilterExpression={"session_date": {"$exists": True}}
+        )
+        db["daily_attendance_summary"].create_index([("class_id", 1), ("section", 1), ("date", 1)], unique=True)
+        _indexes_ensured = True
+
+def voiceprint_version(db):
+    """Current value of the change counter advanced on every voiceprint write"""
+    counter = db["counters"].find_one({"_id": "voiceprints"})
+    return counter['version'] if counter else 0
+
+def bump_voiceprint_version(db):
+    """Advance the voiceprint change counter after writing voice_features; returns the new version"""
+    counter = db["counters"].find_one_and_update(
+        {"_id": "voiceprints"},
+        {"$inc": {"version": 1}},
+        upsert=True,
+        return_document=ReturnDocument.AFTER
+    )
+    return counter['version']
+
+def session_date(time):
+    """Midnight of the day an attendance record belongs to"""
+    return datetime.datetime.combine(time.date(), datetime.time.min)
+
+def find_classes(db):
+    """Every class with its sections"""
+    return list(db["classes"].find({}))
+
+def find_class(db, name):
+    """The class with the given name, or None"""
+    return db["classes"].find_one({"name": name})
+
+def add_class(db, name, sections):
+    """Create a class; returns the new class, or None if the name is taken"""
+    if find_class(db, name):
+        return None
+    cls = {
+        "name": name,
+        "sections": sections,
+        "created_at": datetime.datetime.now()
+    }
+    db["classes"].insert_one(cls)
+    return cls
+
+def find_students(db, class_id=None, section=None):
+    """Enrolled students, optionally of one class/section, without their voiceprints"""
+    query = {}
+    if class_id is not None:
+        query["class_id"] = class_id
+    if section is not None:
+        query["section"] = section
+    return list(db["students"].find(query, STUDENT_FIELDS))
+
+def find_student(db, student_id):
+    """One enrolled student without their voiceprint, or None"""
+    return db["students"].find_one({"student_id": student_id}, STUDENT_FIELDS)
+
+def student_exists(db, student_id):
+    """Whether a student ID is already enrolled"""
+    return db["students"].count_documents({"student_id": student_id}, limit=1) > 0
+
+def insert_student(db, student):
+    """Store a newly enrolled student; the unique student_id index rejects duplicates"""
+    db["students"].insert_one(student)
+
+def student_counts(db):
+    """Per-class and per-section enrollment counts from a single aggregation"""
+    class_counts = {}
+    section_counts = {}
+    pipeline = [{"$group": {
+        "_id": {"class_id": "$class_id", "section": "$section"},
+        "count": {"$sum": 1}
+    }}]
+    for row in db["students"].aggregate(pipeline):
+        class_id = row['_id'].get('class_id')
+        section = row['_id'].get('section')
+        section_counts[(class_id, section)] = row['count']
+        class_counts[class_id] = class_counts.get(class_id, 0) + row['count']
+    return {"classes": class_counts, "sections": section_counts}
+
+def attendance_record(student_id, name, class_id, section, time, status):
+    """Attendance document for a student marked at the given time"""
+    return {
+        "student_id": student_id,
+        "name": name,
+        "class_id": class_id,
+        "section": section,
+        "date": time,
+        "session_date": session_date(time),
+        "status": status,
+        "timestamp": datetime.datetime.now()
+    }
+
+def write_attendance(db, records):
+    """Insert records for students not yet marked in their session and add them to the rollup; returns those written"""
+    # Keyed like the unique session index, so a student already marked is left untouched
+    key_fields = ("student_id", "class_id", "section", "session_date")
+    operations = [
+        UpdateOne({field: record[field] for field in key_fields},
+                  {"$setOnInsert": {field: value for field, value in record.items() if field not in key_fields}},
+                  upsert=True)
+        for record in records
+    ]
+    if not operations:
+        return []
+    try:
+        upserted = db["attendance"].bulk_write(operations, ordered=False).upserted_ids
+    except BulkWriteError as e:
+        # Another station marking the same session at the same moment is a duplicate, not a failure
+        if any(error['code'] != 11000 for error in e.details.get('writeErrors', [])):
+            raise
+        upserted = {item['index']: item['_id'] for item in e.details.get('upserted', [])}
+    
+    written = [records[position] for position in sorted(upserted)]
+    try:
+        for record in written:
+            record_daily_summary(db["daily_attendance_summary"], record)
+    except PyMongoError as e:
+        # The records are stored, so recount their days instead of reporting the marks as failed
+        logger.warning(f"Could not update the daily attendance summary, rebuilding it: {str(e)}")
+        repair_daily_summary(db, written)
+    return written
+
+def repair_daily_summary(db, records):
+    """Recompute the rollup for the sections and days of the given records"""
+    for class_id, section, day in {(r['class_id'], r['section'], r['session_date']) for r in records}:
+        try:
+            rebuild_daily_summary(db, {
+                "class_id": class_id,
+                "section": section,
+                "date": {"$gte": day, "$lt": day + datetime.timedelta(days=1)}
+            })
+        except PyMongoError as e:
+            logger.error(f"Daily summary for {section} on {day.date()} is stale, "
+                         f"run --rebuild-daily-summary: {str(e)}")
+
+def section_attendance(db, class_id, section, since):
+    """A section's attendance records since the given time, newest first"""
+    query = {"date": {"$gte": since}, "class_id": class_id, "section": section}
+    return list(db["attendance"].find(query).sort("date", -1))
+
+def marked_student_ids(db, class_id, section, since):
+    """IDs of students in a section already marked since the given time"""
+    return set(db["attendance"].distinct("student_id", {
+        "class_id": class_id,
+        "section": section,
+        "date": {"$gte": since}
+    }))
+
+def delete_attendance(db, class_id, section, day):
+    """Delete a class's (or one section's) attendance and rollup from the given day on; returns the records deleted"""
+    query = {"date": {"$gte": day}, "class_id": class_id}
+    summary_query = {"class_id": class_id, "date": day}
+    if section:
+        query["section"] = section
+        summary_query["section"] = section
+    result = db["attendance"].delete_many(query)
+    db["daily_attendance_summary"].delete_many(summary_query)
+    return result.deleted_count
+
+def record_daily_summary(summary_col, record):
+    """Add one newly written attendance record to the daily rollup"""
+    summary_col.update_one(
+        {"class_id": record['class_id'], "section": record['section'], "date": session_date(record['date'])},
+        {
+            "$addToSet": {"student_ids": record['student_id']},
+            "$inc": {"present_count": 1},
+            "$set": {"updated_at": datetime.datetime.now()}
+        },
+        upsert=True
+    )
+
+def rebuild_daily_summary(db, query=None):
+    """Recompute daily_attendance_summary from raw attendance records"""
+    query = query or {}
+    db["daily_attendance_summary"].delete_many(query)
+    day = {"$dateFromString": {"dateString": {"$dateToString": {"format": "%Y-%m-%d", "date": "$date"}}}}
+    pipeline = [
+        {"$match": query},
+        {"$group": {
+            "_id": {"class_id": "$class_id", "section": "$section", "date": day},
+            "student_ids": {"$addToSet": "$student_id"}
+        }},
+        {"$project": {
+            "_id": 0,
+            "class_id": "$_id.class_id",
+            "section": "$_id.section",
+            "date": "$_id.date",
+            "student_ids": 1,
+            "present_count": {"$size": "$student_ids"},
+            "updated_at": "$$NOW"
+        }},
+        {"$merge": {
+            "into": "daily_attendance_summary",
+            "on": ["class_id", "section", "date"],
+            "whenMatched": "replace",
+            "whenNotMatched": "insert"
+        }}
+    ]
+    db["attendance"].aggregate(pipeline, allowDiskUse=True)
+    return db["daily_attendance_summary"].count_documents(query)
+
+def voiceprint_fields(templates):
+    """Student voiceprint fields for one or more enrollment samples: a centroid plus per-sample templates"""
+    fields = {"voice_features": voiceprint_centroid(templates).tolist()}
+    if len(templates) > 1:
+        fields["voice_templates"] = [VoiceprintIndex.to_vector(template).tolist() for template in templates]
+    return fields
+
+def migrate_voice_features(students_col, students, extractor):
+    """Re-extract voiceprints from enrollment WAVs for students enrolled with another extractor"""
+    migrated = 0
+    for student in students:
+        if student.get('feature_extractor', StatsFeatureExtractor.name) == extractor.name:
+            continue
+            
+        filepaths = student.get('voice_sample_paths') or [student.get('voice_sample_path')]
+        if not all(filepath and os.path.exists(filepath) for filepath in filepaths):
+            logger.warning(f"Cannot migrate voiceprint for {student['student_id']}: "
+                           f"enrollment sample not found, re-enrollment required")
+            continue
+            
+        try:
+            templates = []
+            for filepath in filepaths:
+                audio_data, sample_rate = sf.read(filepath)
+                templates.append(extractor.extract(audio_data, sample_rate))
+            update = dict(voiceprint_fields(templates), feature_extractor=extractor.name,
+                          updated_at=datetime.datetime.now())
+            students_col.update_one({"_id": student['_id']}, {"$set": update})
+            student['feature_extractor'] = extractor.name
+            migrated += 1
+        except Exception as e:
+            logger.error(f"Error migrating voiceprint for {student['student_id']}: {str(e)}")
+    
+    if migrated:
+        bump_voiceprint_version(students_col.database)
+        logger.info(f"Migrated {migrated} voiceprints to {extractor.name}")
+    return migrated
@@ -0,0 +1,134 @@
+"""Memory-mapped on-disk voiceprint store, versioned against MongoDB"""
+import os
+import json
+import logging
+import threading
+import numpy as np
+
+from .features import StatsFeatureExtractor
+from .matching import VoiceprintIndex, IVFVoiceprintIndex, create_voiceprint_index
+from .repository import voiceprint_version
+
+logger = logging.getLogger(__name__)
+
+def extractor_query(extractor_name):
+    """Students whose voiceprints were produced by the given extractor"""
+    if extractor_name == StatsFeatureExtractor.name:
+        # Students enrolled before extractors were recorded used the stats features
+        return {"$or": [{"feature_extractor": extractor_name}, {"feature_extractor": {"$exists": False}}]}
+    return {"feature_extractor": extractor_name}
+
+class VoiceprintStore:
+    """Normalised voiceprints in a memory-mapped .npy file with a JSON sidecar of student IDs and version"""
+    def __init__(self, extractor_name, directory=None):
+        self.extractor_name = extractor_name
+        self.directory = directory or os.getenv("VOICEPRINT_STORE_DIR", "voiceprints")
+        self.matrix_path = os.path.join(self.directory, f"{extractor_name}.npy")
+        self.sidecar_path = os.path.join(self.directory, f"{extractor_name}.json")
+        self.partitions_path = os.path.join(self.directory, f"{extractor_name}.ivf.npz")
+    
+    def read(self):
+        """Mapped (matrix, ids, version), or None when the store is missing or incomplete"""
+        try:
+            with open(self.sidecar_path) as f:
+                sidecar = json.load(f)
+            matrix = np.load(self.matrix_path, mmap_mode="r")
+        except (OSError, ValueError) as e:
+            logger.info(f"No usable voiceprint store in {self.directory}: {str(e)}")
+            return None
+        
+        if sidecar.get('extractor') != self.extractor_name or len(sidecar.get('ids', [])) != len(matrix):
+            logger.warning(f"Voiceprint store {self.matrix_path} does not match its sidecar, rebuilding")
+            return None
+        return matrix, sidecar['ids'], sidecar['version']
+    
+    def write(self, matrix, ids, version):
+        """Replace the store; the sidecar goes last so a half-written matrix is never used"""
+        os.makedirs(self.directory, exist_ok=True)
+        with open(self.matrix_path + ".tmp", "wb") as f:
+            np.save(f, np.asarray(matrix, dtype=np.float32))
+        os.replace(self.matrix_path + ".tmp", self.matrix_path)
+        
+        with open(self.sidecar_path + ".tmp", "w") as f:
+            json.dump({
+                "version": version,
+                "extractor": self.extractor_name,
+                "dimension": int(matrix.shape[1]) if len(ids) else 0,
+                "ids": [str(student_id) for student_id in ids]
+            }, f)
+        os.replace(self.sidecar_path + ".tmp", self.sidecar_path)
+    
+    def save(self, index, version):
+        """Persist an index's voiceprints (and clustering, if any) as the given version"""
+        try:
+            self.write(index.matrix, index.ids, version)
+            if isinstance(index, IVFVoiceprintIndex):
+                index.save_partitions(self.partitions_path, version)
+            logger.info(f"Saved {len(index)} voiceprints to {self.matrix_path} at version {version}")
+        except OSError as e:
+            logger.warning(f"Could not save voiceprint store {self.matrix_path}: {str(e)}")
+    
+    def open(self, db, kind=None):
+        """Voiceprint index for this extractor plus the database version it reflects"""
+        # Read the version first: writes that land while rebuilding leave the store behind, never ahead
+        version = voiceprint_version(db)
+        index = create_voiceprint_index(kind)
+        
+        stored = self.read()
+        if stored is not None and stored[2] == version:
+            matrix, ids, _ = stored
+            index.attach(matrix, ids)
+            logger.info(f"Mapped {len(ids)} voiceprints from {self.matrix_path} at version {version}")
+            if isinstance(index, IVFVoiceprintIndex) and not index.load_partitions(self.partitions_path, version):
+                index.train()
+                index.save_partitions(self.partitions_path, version)
+            return index, version
+        
+        # Stale or missing: stream only the voiceprints from MongoDB and rewrite the store
+        students = db["students"].find(
+            extractor_query(self.extractor_name),
+            {"_id": 0, "student_id": 1, "voice_features": 1, "feature_extractor": 1}
+        )
+        index.build(students, self.extractor_name)
+        self.save(index, version)
+        return index, version
+
+class VoiceTemplateCache:
+    """Per-sample enrollment templates, fetched on demand to re-score the top centroid matches"""
+    def __init__(self, students_col, extractor_name, max_entries=10000):
+        self.students_col = students_col
+        self.extractor_name = extractor_name
+        self.max_entries = max_entries
+        self.templates = {}
+        self.lock = threading.Lock()
+    
+    def __call__(self, student_ids):
+        """Normalised template matrices for the given students (empty for single-sample enrollments)"""
+        with self.lock:
+            missing = [student_id for student_id in student_ids if student_id not in self.templates]
+        if missing:
+            query = dict(extractor_query(self.extractor_name), student_id={"$in": missing})
+            fetched = {student_id: [] for student_id in missing}
+            for student in self.students_col.find(query, {"_id": 0, "student_id": 1, "voice_templates": 1}):
+                fetched[student['student_id']] = student.get('voice_templates') or []
+            self.preload(fetched)
+        with self.lock:
+            return {student_id: self.templates.get(student_id) for student_id in student_ids}
+    
+    def preload(self, templates):
+        """Cache templates given as {student_id: [per-sample features]}"""
+        with self.lock:
+            for student_id, samples in templates.items():
+                if len(self.templates) >= self.max_entries:
+                    # Evict the oldest entry
+                    self.templates.pop(next(iter(self.templates)))
+                if samples:
+                    matrix = VoiceprintIndex.normalize(np.vstack([VoiceprintIndex.to_vector(s) for s in samples]))
+                else:
+                    matrix = np.empty((0, 0), dtype=np.float32)
+                self.templates[student_id] = matrix
+    
+    def discard(self, student_id):
+        """Forget a student's templates after they changed"""
+        with self.lock:
+            self.templates.pop(student_id, None)
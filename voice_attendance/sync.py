@@ -0,0 +1,130 @@
+"""Incremental student sync between stations sharing one database"""
+import datetime
+import logging
+from pymongo.errors import OperationFailure, PyMongoError
+
+logger = logging.getLogger(__name__)
+
+class StudentSync:
+    """Feeds batches of ("upsert", document) / ("delete", student_id) changes from a change stream or polling"""
+    def __init__(self, students_col, students, since, poll_interval=5.0, overlap=30.0):
+        self.students_col = students_col
+        self.since = since
+        self.poll_interval = poll_interval
+        # Writers stamp updated_at with their own clock, so re-read a window to tolerate skew
+        self.overlap = datetime.timedelta(seconds=overlap)
+        self.applied = {}
+        self.student_ids = {student['student_id'] for student in students}
+        self.object_ids = {student['_id']: student['student_id'] for student in students if '_id' in student}
+        self.resume_token = None
+        self.caught_up = False
+    
+    def run(self, emit, stop):
+        """Call emit with each batch of changes until the stop event is set"""
+        while not stop.is_set():
+            try:
+                self.watch(emit, stop)
+            except OperationFailure as e:
+                # Standalone mongod has no change streams
+                logger.info(f"Change streams unavailable ({str(e)}), polling for student changes")
+                self.catch_up(emit)
+                self.poll(emit, stop)
+            except PyMongoError as e:
+                logger.warning(f"Student change stream interrupted: {str(e)}")
+                stop.wait(self.poll_interval)
+    
+    def watch(self, emit, stop):
+        """Follow the students collection's change stream"""
+        with self.students_col.watch(full_document="updateLookup", max_await_time_ms=1000,
+                                     resume_after=self.resume_token) as stream:
+            logger.info("Following student changes through a change stream")
+            # The stream is open, so anything written from here on is in it; catch up on what came before
+            self.catch_up(emit)
+            changes = []
+            while not stop.is_set():
+                event = stream.try_next()
+                self.resume_token = stream.resume_token
+                if event is not None:
+                    change = self.from_event(event)
+                    if change is not None:
+                        changes.append(change)
+                    continue
+                
+                # The stream is drained: deliver what arrived as one batch
+                if changes:
+                    emit(changes)
+                    changes = []
+    
+    def catch_up(self, emit):
+        """Emit anything written between the initial load and the start of following changes"""
+        if self.caught_up:
+            return
+        try:
+            changes = self.poll_once()
+        except PyMongoError as e:
+            logger.warning(f"Could not catch up on student changes: {str(e)}")
+            return
+        self.caught_up = True
+        if changes:
+            emit(changes)
+    
+    def from_event(self, event):
+        """Translate a change stream event into a change, or None if it is not relevant"""
+        operation = event['operationType']
+        if operation in ("insert", "update", "replace"):
+            document = event.get('fullDocument')
+            if document is None:
+                # Deleted again before the update was looked up
+                return None
+            return self.upserted(document)
+        if operation == "delete":
+            student_id = self.object_ids.pop(event['documentKey']['_id'], None)
+            if student_id is not None:
+                self.student_ids.discard(student_id)
+                return ("delete", student_id)
+        return None
+    
+    def upserted(self, document):
+        """Record an inserted or updated student and return its change"""
+        self.student_ids.add(document['student_id'])
+        self.object_ids[document['_id']] = document['student_id']
+        return ("upsert", document)
+    
+    def poll(self, emit, stop):
+        """Poll updated_at for changes until the stop event is set"""
+        while not stop.wait(self.poll_interval):
+            try:
+                changes = self.poll_once()
+            except PyMongoError as e:
+                logger.warning(f"Polling for student changes failed: {str(e)}")
+                continue
+            if changes:
+                emit(changes)
+    
+    def poll_once(self):
+        """Changes since the previous poll"""
+        changes = []
+        horizon = self.since - self.overlap
+        for document in self.students_col.find({"updated_at": {"$gt": horizon}}).sort("updated_at", 1):
+            key = (document['student_id'], document['updated_at'])
+            if key in self.applied:
+                continue
+            self.applied[key] = document['updated_at']
+            self.since = max(self.since, document['updated_at'])
+            changes.append(self.upserted(document))
+        self.applied = {key: time for key, time in self.applied.items() if time > self.since - self.overlap}
+        
+        # Deletes leave no updated_at behind, so compare the ID set whenever the count drifts
+        if self.students_col.estimated_document_count() != len(self.student_ids):
+            current = set(self.students_col.distinct("student_id"))
+            for student_id in self.student_ids - current:
+                changes.append(("delete", student_id))
+            self.object_ids = {oid: sid for oid, sid in self.object_ids.items() if sid in current}
+            
+            # Students written without updated_at (older clients) are picked up here
+            missing = current - self.student_ids
+            self.student_ids = current - missing
+            if missing:
+                for document in self.students_col.find({"student_id": {"$in": list(missing)}}):
+                    changes.append(self.upserted(document))
+        return changes